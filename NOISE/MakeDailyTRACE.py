@@ -37,7 +37,10 @@ import pandas as pd
 import numpy as np
 import QuantLib as ql
 from joblib import Parallel, delayed
-import wrds
+import sys
+sys.path.append('..')
+from tracelib.fisd import load_fisd, universe_mask, plain, PRICING_RULES
+from tracelib.connection import connect
 import zipfile
 import csv
 import gzip
@@ -68,27 +71,14 @@ traced = dfp.merge(dfv, how = "inner", left_on = ['trd_exctn_dt','cusip_id'],
 #* ************************************** */
 #* Connect to WRDS                        */
 #* ************************************** */  
-db = wrds.Connection()
+db = connect()
 
 #* ************************************** */
-#* Download Mergent File                  */
+#* Load Mergent File                      */
 #* ************************************** */  
-fisd_issuer = db.raw_sql("""SELECT issuer_id,country_domicile,sic_code                
-                  FROM fisd.fisd_mergedissuer 
-                  """)
-
-fisd_issue = db.raw_sql("""SELECT complete_cusip, issue_id,
-                  issuer_id, foreign_currency,
-                  coupon_type,coupon,convertible,
-                  asset_backed,rule_144a,
-                  bond_type,private_placement,
-                  interest_frequency,dated_date,
-                  day_count_basis,offering_date,
-                  offering_amt, maturity
-                  FROM fisd.fisd_mergedissue  
-                  """)
-                  
-fisd = pd.merge(fisd_issue, fisd_issuer, on = ['issuer_id'], how = "left")
+# Issue and issuer tables, read from the local snapshot after the first
+# pull (tracelib.fisd) #
+fisd = load_fisd(db)
         
 #* ************************************** */
 #* Ensure KPP Bonds are in the sample     */
@@ -102,57 +92,17 @@ IDs_KPP = pd.read_csv('cusips.csv')
 IDs_KPP.drop(['Unnamed: 0'], axis = 1, inplace = True)
 IDs_KPP.columns = ['complete_cusip']
 
-fisd_kpp =  fisd[fisd['complete_cusip'].isin(IDs_KPP['complete_cusip'])]
+fisd_kpp =  plain(fisd[fisd['complete_cusip'].isin(IDs_KPP['complete_cusip'])])
 fisd_kpp.rename(columns={'complete_cusip':'cusip'}, inplace=True)
   
 #* ************************************** */
 #* Apply BBW Bond Filters                 */
 #* ************************************** */  
-#1: Discard all non-US Bonds (i) in BBW
-fisd = fisd[(fisd.country_domicile == 'USA')]
-
-#2.1: US FX
-fisd = fisd[(fisd.foreign_currency == 'N')]
-
-#3: Must have a fixed coupon
-fisd = fisd[(fisd.coupon_type != 'V')]
-
-#4: Discard ALL convertible bonds
-fisd = fisd[(fisd.convertible == 'N')]
-
-#5: Discard all asset-backed bonds
-fisd = fisd[(fisd.asset_backed == 'N')]
-
-#6: Discard all bonds under Rule 144A
-fisd = fisd[(fisd.rule_144a == 'N')]
-
-#7: Remove Agency bonds, Muni Bonds, Government Bonds, 
-mask_corp = ((fisd.bond_type != 'TXMU')&  (fisd.bond_type != 'CCOV') &  (fisd.bond_type != 'CPAS')\
-            &  (fisd.bond_type != 'MBS') &  (fisd.bond_type != 'FGOV')\
-            &  (fisd.bond_type != 'USTC')   &  (fisd.bond_type != 'USBD')\
-            &  (fisd.bond_type != 'USNT')  &  (fisd.bond_type != 'USSP')\
-            &  (fisd.bond_type != 'USSI') &  (fisd.bond_type != 'FGS')\
-            &  (fisd.bond_type != 'USBL') &  (fisd.bond_type != 'ABS')\
-            &  (fisd.bond_type != 'O30Y')\
-            &  (fisd.bond_type != 'O10Y') &  (fisd.bond_type != 'O3Y')\
-            &  (fisd.bond_type != 'O5Y') &  (fisd.bond_type != 'O4W')\
-            &  (fisd.bond_type != 'CCUR') &  (fisd.bond_type != 'O13W')\
-            &  (fisd.bond_type != 'O52W')\
-            &  (fisd.bond_type != 'O26W')\
-            # Remove all Agency backed / Agency bonds #
-            &  (fisd.bond_type != 'ADEB')\
-            &  (fisd.bond_type != 'AMTN')\
-            &  (fisd.bond_type != 'ASPZ')\
-            &  (fisd.bond_type != 'EMTN')\
-            &  (fisd.bond_type != 'ADNT')\
-            &  (fisd.bond_type != 'ARNT'))
-fisd = fisd[(mask_corp)]
-
-#8: No Private Placement
-fisd = fisd[(fisd.private_placement == 'N')]
-
-#9: Remove floating-rate, bi-monthly and unclassified coupons
-fisd = fisd[(fisd.interest_frequency != 13) ] # Variable Coupon (V)
+# 1-9: non-US, foreign currency, variable coupon, convertible,
+# asset-backed, Rule 144A, non-corporate bond types, private placement,
+# excluded interest frequencies, and missing interest frequency or
+# offering date (tracelib.fisd.PRICING_RULES) #
+fisd = plain(fisd[universe_mask(fisd, **PRICING_RULES)])
 
 #10 Remove bonds lacking information for accrued interest (and hence returns)
 fisd['offering_date']            = pd.to_datetime(fisd['offering_date'], 
@@ -171,13 +121,8 @@ fisd['day_count_basis'].value_counts(normalize = True)
 #* ************************************** */
 #* Filter fisd file                       */
 #* ************************************** */ 
-fisd = fisd[(fisd.interest_frequency != "-1") ]   # Unclassified by Mergent
-fisd = fisd[(fisd.interest_frequency != "13") ]   # Variable Coupon (V)
-fisd = fisd[(fisd.interest_frequency != "14") ]   # Bi-Monthly Coupon
-fisd = fisd[(fisd.interest_frequency != "16") ]   # Unclassified by Mergent
-fisd = fisd[(fisd.interest_frequency != "15") ]   # Unclassified by Mergent
-fisd = fisd[(~fisd.interest_frequency.isnull()) ] # Unclassified by Mergent
-fisd = fisd[(~fisd.offering_date.isnull()) ] # Unclassified by Mergent
+# Interest frequency and offering date screens are part of
+# universe_mask above #
 fisd['day_count_basis'] = np.where(fisd['day_count_basis'].isnull(),
                                  "30/360", fisd['day_count_basis'])
 
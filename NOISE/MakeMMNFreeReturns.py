@@ -4,7 +4,10 @@ from tqdm import tqdm
 from dateutil.relativedelta import *
 from pandas.tseries.offsets import *
 import datetime as datetime
-import wrds
+import sys
+sys.path.append('..')
+from tracelib.connection import connect
+from tracelib.stream import read_filtered
 tqdm.pandas()
 
 #* ************************************** */
@@ -58,7 +61,7 @@ df['month_end']    = df['date'] + pd.offsets.MonthEnd(0)
 #* ************************************** */
 #* Connect to WRDS                        */
 #* ************************************** */  
-db = wrds.Connection()
+db = connect()
 
 #* ************************************** */
 #* WRDS Bond Returns                      */
@@ -66,10 +69,12 @@ db = wrds.Connection()
 # We only require 2 variables from the WRDS Bond Returns Module
 # T_DATE, is the actual bond transaction date
 # CUSIP is the identifier
-
-traced = db.raw_sql("""SELECT  T_DATE, CUSIP
+# Streamed in batches (tracelib.stream); only bonds with daily prices are
+# kept, the others never match in the left merge below #
+traced = read_filtered(db, """SELECT  T_DATE, CUSIP
                         FROM wrdsapps.bondret
-                    """)
+                    """,
+                       keep = lambda b: b[b['cusip'].isin(df['CUSIP_ID'])])
 
 traced = traced[['t_date','cusip']]
 traced['t_date'] = pd.to_datetime(traced['t_date'])
@@ -43,7 +43,9 @@ from pandas.tseries.offsets import *
 import datetime as datetime
 from pandas.tseries.offsets import *
 import pyreadstat
-import wrds
+import sys
+sys.path.append('..')
+from tracelib.connection import connect
 import pandasql as ps
 import urllib.request
 import zipfile
@@ -52,7 +54,7 @@ tqdm.pandas()
 #* ************************************** */
 #* Connect to WRDS                        */
 #* ************************************** */  
-db = wrds.Connection()
+db = connect()
 
 #* ************************************** */
 #* Download Mergent File                  */
@@ -43,13 +43,15 @@ from pandas.tseries.offsets import *
 import pandas_datareader as pdr
 import datetime as datetime
 from joblib import Parallel, delayed  
-import wrds  
+import sys
+sys.path.append('..')
+from tracelib.connection import connect
 tqdm.pandas()
 
 #* ************************************** */
 #* Connect to WRDS                        */
 #* ************************************** */  
-db = wrds.Connection()
+db = connect()
 
 #* ************************************** */
 #* Download Mergent File                  */
@@ -42,7 +42,6 @@ from pandas.tseries.offsets import *
 from datetime import datetime, timedelta
 import urllib.request
 import zipfile
-import wrds  
 tqdm.pandas()
 
 #* ************************************** */
@@ -19,8 +19,8 @@ Bao et al. (2011) Equation (2) from the Journal of Finance paper.
 Requirements
 -------------
 Data output from "MakeBondDailyMetrics.py" including
-    (1) Prices_BBW_TRACE_Enhanced_Dick_Nielsen.csv.gzip
-    (2) Volumes_BBW_TRACE_Enhanced_Dick_Nielsen.csv.gzip
+    (1) Prices_BBW_TRACE_Enhanced_Dick_Nielsen.parquet
+    (2) Volumes_BBW_TRACE_Enhanced_Dick_Nielsen.parquet
 
 Package versions 
 -------------
@@ -40,17 +40,20 @@ from dateutil.relativedelta import *
 from pandas.tseries.offsets import *
 from datetime import datetime, timedelta
 from datetime import datetime
+import sys
+sys.path.append('..')
+from tracelib.artifacts import read_artifact
 tqdm.pandas()
 
 #* ************************************** */
 #* Load daily data                        */
 #* ************************************** */
-df  = pd.read_csv\
-    ('Prices_BBW_TRACE_Enhanced_Dick_Nielsen.csv.gzip',
-     compression='gzip')
-dfv = pd.read_csv\
-    ('Volumes_BBW_TRACE_Enhanced_Dick_Nielsen.csv.gzip',
-     compression = "gzip")
+# Typed Parquet (tracelib.artifacts): only the columns used, dates
+# already parsed #
+df  = read_artifact('Prices_BBW_TRACE_Enhanced_Dick_Nielsen.parquet',
+                    columns = ['prc_vw'])
+dfv = read_artifact('Volumes_BBW_TRACE_Enhanced_Dick_Nielsen.parquet',
+                    columns = ['qvolume', 'dvolume'])
 
 #* ************************************** */
 #* Convert column names to upper (for now)*/
@@ -59,14 +62,6 @@ dfv = pd.read_csv\
 df.columns = map(str.upper , df.columns)
 dfv.columns = map(str.upper, dfv .columns)
 
-#* ************************************** */
-#* Convert Trade Execution date to a      */
-#* date type                              */
-#* ************************************** */
-
-df[ 'TRD_EXCTN_DT'] =  df['TRD_EXCTN_DT'].values.astype('M8[D]')
-dfv['TRD_EXCTN_DT'] = dfv['TRD_EXCTN_DT'].values.astype('M8[D]')
-
 #* ************************************** */
 #* Merge                                  */
 #* ************************************** */
@@ -42,7 +42,10 @@ from dateutil.relativedelta import *
 from pandas.tseries.offsets import *
 import datetime as datetime
 from pandas.tseries.offsets import *
-import wrds
+import sys
+sys.path.append('..')
+from tracelib.connection import connect
+from tracelib.stream import read_filtered
 import urllib.request
 import zipfile
 tqdm.pandas()
@@ -50,27 +53,31 @@ tqdm.pandas()
 #* ************************************** */
 #* Connect to WRDS                        */
 #* ************************************** */  
-db = wrds.Connection()
+db = connect()
 
 #* ************************************** */
 #* Download Mergent File                  */
 #* ************************************** */  
-rat = db.raw_sql("""SELECT issue_id, rating_type, rating_date,rating               
-                  FROM fisd.fisd_ratings
-                  """)
+# The ratings table is streamed and filtered batch by batch
+# (tracelib.stream), so only the kept ratings are ever held in memory #
+def keep_ratings(rat):
+    # Keep SP and Moody's Ratings #
+    rat = rat[ ( (rat['rating_type'] == "SPR")|\
+                 (rat['rating_type'] == "MR") ) ]
 
-# Keep SP and Moody's Ratings #
-rat = rat[ ( (rat['rating_type'] == "SPR")|\
-             (rat['rating_type'] == "MR") ) ]
+    # Remove from sample, ALL bonds with an "NR" (not rated) and the "NR",
+    # derivatives category #
+    rat = rat[rat['rating'] != "NR"]
+    rat = rat[rat['rating'] != 'NR/NR']
+    rat = rat[rat['rating'] != 'SUSP']
+    rat = rat[rat['rating'] != 'P-1']
+    rat = rat[rat['rating'] != '0']
+    rat = rat[rat['rating'] != 'NAV']
+    return rat
 
-# Remove from sample, ALL bonds with an "NR" (not rated) and the "NR",
-# derivatives category #
-rat = rat[rat['rating'] != "NR"]
-rat = rat[rat['rating'] != 'NR/NR']
-rat = rat[rat['rating'] != 'SUSP']
-rat = rat[rat['rating'] != 'P-1']
-rat = rat[rat['rating'] != '0']
-rat = rat[rat['rating'] != 'NAV']
+rat = read_filtered(db, """SELECT issue_id, rating_type, rating_date,rating               
+                  FROM fisd.fisd_ratings
+                  """, keep = keep_ratings)
 
 # S&P Ratings #
 ratsp = rat[  (rat['rating_type'] == "SPR") ]
@@ -11,7 +11,9 @@ from pandas.tseries.offsets import *
 import pandas_datareader as pdr
 import datetime as datetime
 from joblib import Parallel, delayed    
-import wrds
+import sys
+sys.path.append('..')
+from tracelib.connection import connect
 tqdm.pandas()
 
 
@@ -34,7 +36,7 @@ tqdm.pandas()
 #* ************************************** */
 #* Connect to WRDS                        */
 #* ************************************** */  
-db = wrds.Connection()
+db = connect()
 
 #* ************************************** */
 #* CRSP Fixed Term Indices                */
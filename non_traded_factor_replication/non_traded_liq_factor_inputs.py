@@ -9,24 +9,24 @@ from datetime import datetime
 import statsmodels.api as sm
 import pandas_datareader as pdr
 import datetime as datetime
+import sys
+sys.path.append('..')
+from tracelib.artifacts import read_artifact
 tqdm.pandas()
 
 #* ************************************** */
 #* Load daily data                        */
 #* ************************************** */
-df  = pd.read_csv\
-    (r'~\Prices_BBW_TRACE_Enhanced_Dick_Nielsen.csv.gzip',
-     compression='gzip')
-dfv = pd.read_csv\
-    (r'~\Volumes_BBW_TRACE_Enhanced_Dick_Nielsen.csv.gzip',
-     compression = "gzip")
+# Typed Parquet (tracelib.artifacts): only the columns used, dates
+# already parsed #
+df  = read_artifact(r'~\Prices_BBW_TRACE_Enhanced_Dick_Nielsen.parquet',
+                    columns = ['prc_vw'])
+dfv = read_artifact(r'~\Volumes_BBW_TRACE_Enhanced_Dick_Nielsen.parquet',
+                    columns = ['qvolume', 'dvolume'])
 
 df.columns = map(str.upper , df.columns)
 dfv.columns = map(str.upper, dfv .columns)
 
-df[ 'TRD_EXCTN_DT'] =  df['TRD_EXCTN_DT'].values.astype('M8[D]')
-dfv['TRD_EXCTN_DT'] = dfv['TRD_EXCTN_DT'].values.astype('M8[D]')
-
 #* ************************************** */
 #* Merge                                  */
 #* ************************************** */
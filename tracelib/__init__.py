@@ -0,0 +1,9 @@
+'''
+Overview
+-------------
+Shared building blocks for the TRACE cleaning scripts.
+
+The scripts in TRACE/, NOISE/ and enhanced_trace_cleaning/ are run from
+their own folder, so they put the repository root on the path with
+sys.path.append('..') before importing from this package.
+'''
@@ -0,0 +1,174 @@
+'''
+Overview
+-------------
+Daily (or per-bucket) prices, volumes and bid / ask prices of cleaned
+trades from one grouped reduction.
+
+The cleaners built each output with its own groupby: the equal-weighted
+price, the value weights (a Python lambda per group), the volume-weighted
+price (a second lambda), two volume sums, and the weights and weighted
+price again for the bid (rpt_side_cd S) and ask (B) trades. trade_sums()
+instead computes, per trade, the additive components of every output
+
+    n_prc, sum_prc                 priced trades and the sum of prices
+    sum_vol, sum_prc_vol           volume and price x volume
+    sum_dollar_vol                 dollar volume, rounded per trade
+    n_bid, bid_vol, bid_prc_vol    the same on dealer-sell (S) trades
+    n_ask, ask_vol, ask_prc_vol    and on dealer-buy (B) trades
+
+factorizes the group keys once into sorted int64 group numbers
+(tracelib.keys.frame_keys) and adds every component up in one groupby sum
+over those numbers. outputs() then derives the frames arithmetically:
+
+    prc_ew    sum_prc / n_prc
+    prc_vw    sum_prc_vol / sum_vol
+    qvolume   sum_vol
+    dvolume   sum_dollar_vol
+    prc_bid   bid_prc_vol / bid_vol, prc_ask ask_prc_vol / ask_vol, for
+              groups with trades on both sides
+
+These are the values of the previous code up to floating-point rounding:
+sum(p * q / Q) is sum(p * q) / Q, which can differ in the last bit, so a
+weighted price on a rounding tie can move by 0.0001 after rounding.
+Missing prices and volumes are skipped as np.nansum skipped them, and a
+group without volume gets a weighted price of 0. Prices are rounded to 4
+decimals as before. Groups come out sorted by
+their keys, and rows with a missing key are dropped, as in groupby.
+
+With sizes=True the same reduction also sums the components per trade
+size bucket (SIZE_BUCKETS, on par volume entrd_vol_qt):
+
+    small     under $100,000
+    medium    $100,000 to under $1,000,000
+    large     $1,000,000 and more
+
+and size_outputs() derives n_trades, prc_ew, prc_vw, qvolume and dvolume
+per bucket (columns <name>_<bucket>). The standard feeds report trades
+above their cap as 1MM+ or 5MM+; tracelib.standard counts them at the cap,
+which is at least $1,000,000, so they always fall in the large bucket.
+'''
+
+import numpy as np
+import pandas as pd
+
+from tracelib.keys import frame_keys
+
+DAILY_KEYS  = ['cusip_id', 'trd_exctn_dt']
+
+SUM_COLUMNS = ['n_prc', 'sum_prc', 'sum_vol', 'sum_prc_vol', 'sum_dollar_vol',
+               'n_bid', 'bid_vol', 'bid_prc_vol', 'n_ask', 'ask_vol', 'ask_prc_vol']
+
+# Trade size buckets: name, lower (inclusive) and upper (exclusive) par volume #
+SIZE_BUCKETS = [('small', 0.0, 1e5),
+                ('medium', 1e5, 1e6),
+                ('large', 1e6, np.inf)]
+
+SIZE_SUMS    = ['n', 'prc', 'n_prc', 'vol', 'prc_vol', 'dollar_vol']
+
+
+def components(trace, sizes=False):
+    """
+    SUM_COLUMNS of every trade (rptd_pr, entrd_vol_qt, rpt_side_cd), and
+    with sizes=True the SIZE_SUMS of each size bucket (<sum>_<bucket>).
+    """
+    prc  = trace['rptd_pr'].to_numpy('float64')
+    vol  = trace['entrd_vol_qt'].to_numpy('float64')
+    side = trace['rpt_side_cd'].to_numpy(object)
+    bid  = side == 'S'
+    ask  = side == 'B'
+    pv   = np.where(np.isnan(prc) | np.isnan(vol), 0.0, prc * vol)
+    vol0 = np.nan_to_num(vol)
+    dvol = np.nan_to_num(np.round(vol * prc / 100))
+    priced = (~np.isnan(prc)).astype('float64')
+    prc0   = np.nan_to_num(prc)
+    parts  = {'n_prc': priced,
+              'sum_prc': prc0,
+              'sum_vol': vol0,
+              'sum_prc_vol': pv,
+              'sum_dollar_vol': dvol,
+              'n_bid': bid.astype('float64'),
+              'bid_vol': np.where(bid, vol0, 0.0),
+              'bid_prc_vol': np.where(bid, pv, 0.0),
+              'n_ask': ask.astype('float64'),
+              'ask_vol': np.where(ask, vol0, 0.0),
+              'ask_prc_vol': np.where(ask, pv, 0.0)}
+    if sizes:
+        for name, lower, upper in SIZE_BUCKETS:
+            # NaN volumes fall in no bucket #
+            inside = (vol >= lower) & (vol < upper)
+            parts['n_' + name]          = inside.astype('float64')
+            parts['prc_' + name]        = np.where(inside, prc0, 0.0)
+            parts['n_prc_' + name]      = np.where(inside, priced, 0.0)
+            parts['vol_' + name]        = np.where(inside, vol0, 0.0)
+            parts['prc_vol_' + name]    = np.where(inside, pv, 0.0)
+            parts['dollar_vol_' + name] = np.where(inside, dvol, 0.0)
+    return parts
+
+
+def grouped_sums(frame, keys, parts):
+    """
+    Sums of the per-row arrays in parts (a dict) over the groups of the
+    keys columns of frame, indexed by the keys and sorted.
+    """
+    keyed = frame[keys].notna().all(axis=1).to_numpy()
+    if not keyed.all():
+        frame = frame[keyed]
+        parts = {k: v[keyed] for k, v in parts.items()}
+    _, first, inverse = np.unique(frame_keys(frame, keys, sort=True),
+                                  return_index=True, return_inverse=True)
+    index = pd.MultiIndex.from_frame(frame[keys].iloc[first].reset_index(drop=True))
+    # One cythonized sum of every column over the integer group numbers;
+    # pandas compensates the sums (Kahan), as groupby().mean() does #
+    sums  = pd.DataFrame(parts).groupby(inverse.ravel(), sort=True).sum()
+    return sums.set_axis(index, axis=0)
+
+
+def trade_sums(trace, keys=None, sizes=False):
+    """
+    SUM_COLUMNS (and with sizes=True the size bucket sums) per group of the
+    keys columns of trace (default DAILY_KEYS).
+    """
+    keys = DAILY_KEYS if keys is None else list(keys)
+    return grouped_sums(trace, keys, components(trace, sizes))
+
+
+def _ratio(num, den, empty):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den != 0, num / den, empty)
+
+
+def outputs(sums):
+    """Prices, Volumes and Illiq frames of trade_sums(), on its index."""
+    s       = {col: sums[col].to_numpy() for col in SUM_COLUMNS}
+    prices  = pd.DataFrame({'prc_ew': _ratio(s['sum_prc'], s['n_prc'], np.nan),
+                            'prc_vw': _ratio(s['sum_prc_vol'], s['sum_vol'], 0.0)},
+                           index=sums.index).round(4)
+    volumes = pd.DataFrame({'qvolume': s['sum_vol'],
+                            'dvolume': s['sum_dollar_vol']},
+                           index=sums.index)
+    both    = (s['n_bid'] > 0) & (s['n_ask'] > 0)
+    illiq   = pd.DataFrame({'prc_bid': _ratio(s['bid_prc_vol'], s['bid_vol'], 0.0),
+                            'prc_ask': _ratio(s['ask_prc_vol'], s['ask_vol'], 0.0)},
+                           index=sums.index)[both].round(4)
+    return prices, volumes, illiq
+
+
+def size_outputs(sums):
+    """
+    n_trades, prc_ew, prc_vw, qvolume and dvolume of each size bucket of
+    trade_sums(..., sizes=True), on its index.
+    """
+    columns = {}
+    for name, _, _ in SIZE_BUCKETS:
+        s = {col: sums[col + '_' + name].to_numpy() for col in SIZE_SUMS}
+        columns['n_trades_' + name] = s['n'].astype('int64')
+        columns['prc_ew_' + name]   = _ratio(s['prc'], s['n_prc'], np.nan).round(4)
+        columns['prc_vw_' + name]   = _ratio(s['prc_vol'], s['vol'], np.nan).round(4)
+        columns['qvolume_' + name]  = s['vol']
+        columns['dvolume_' + name]  = s['dollar_vol']
+    return pd.DataFrame(columns, index=sums.index)
+
+
+def daily_outputs(trace, keys=None):
+    """(Prices, Volumes, Illiq) of the cleaned trades in trace, per group of keys."""
+    return outputs(trade_sums(trace, keys))
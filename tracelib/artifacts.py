@@ -0,0 +1,118 @@
+'''
+Overview
+-------------
+Typed Parquet copies of the daily outputs (Prices, Volumes, Illiq, ...)
+and a reader with column projection and date / CUSIP pushdown.
+
+The cleaners write their daily frames as gzip CSV, and every downstream
+script parses the whole file again, recases the columns and parses the
+dates, whatever part of it it uses. write_artifact() writes the same
+frame as a Parquet dataset partitioned by year of trd_exctn_dt,
+
+    <path>/year=<yyyy>/part-<k>.parquet
+
+with cusip_id a string, trd_exctn_dt a date and the value columns in
+their own types, rows sorted by CUSIP, then date, so every row group
+carries tight min / max statistics of cusip_id. read_artifact() reads only the columns asked for, skips the
+year folders outside [start, end] and the row groups without one of the
+CUSIPs asked for, and returns the rows sorted by CUSIP, then date, with
+trd_exctn_dt as datetime64[ns], as pd.to_datetime did on the CSV.
+'''
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DATE_COLUMN  = 'trd_exctn_dt'
+CUSIP_COLUMN = 'cusip_id'
+
+# Rows per Parquet row group (the unit the CUSIP statistics prune) #
+ROW_GROUP    = 65536
+
+_PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16())]), flavor='hive')
+
+
+def _table(frame):
+    # Flat Arrow table of an indexed daily frame, typed, plus its year #
+    flat  = frame.reset_index()
+    if DATE_COLUMN not in flat.columns:
+        raise ValueError('An artifact needs a ' + DATE_COLUMN + ' column or index level')
+    keys  = [c for c in (CUSIP_COLUMN, DATE_COLUMN) if c in flat.columns]
+    flat  = flat.sort_values(keys, kind='stable', ignore_index=True)
+    table = pa.Table.from_pandas(flat, preserve_index=False)
+    table = table.replace_schema_metadata(None)
+    types = {CUSIP_COLUMN: pa.string(), DATE_COLUMN: pa.date32()}
+    table = table.cast(pa.schema([pa.field(f.name, types.get(f.name, f.type))
+                                  for f in table.schema]))
+    years = flat[DATE_COLUMN].dt.year.to_numpy().astype('int16')
+    return table.append_column('year', pa.array(years, pa.int16()))
+
+
+def _date(value):
+    return pd.Timestamp(value).date()
+
+
+def clear_artifact(path):
+    """Remove the dataset at path, if any."""
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+
+def append_artifact(frame, path, part=0):
+    """Add frame to the dataset at path as files part-<part>.parquet."""
+    table = _table(frame)
+    years = table['year'].to_numpy()
+    for year in np.unique(years):
+        folder = os.path.join(path, 'year=' + str(year))
+        os.makedirs(folder, exist_ok=True)
+        rows   = table.filter(pa.array(years == year)).drop_columns(['year'])
+        pq.write_table(rows, os.path.join(folder, 'part-' + str(part) + '.parquet'),
+                       row_group_size=ROW_GROUP)
+
+
+def write_artifact(frame, path):
+    """Replace the dataset at path with frame."""
+    clear_artifact(path)
+    append_artifact(frame, path)
+
+
+def read_artifact(path, columns=None, cusips=None, start=None, end=None):
+    """
+    Flat frame of the dataset at path: cusip_id, trd_exctn_dt and columns
+    (default all), for the CUSIPs in cusips and dates in [start, end] if
+    given.
+    """
+    dataset = ds.dataset(os.path.expanduser(path), format='parquet',
+                         partitioning=_PARTITIONING)
+    names   = [n for n in dataset.schema.names if n != 'year']
+    if columns is not None:
+        keys    = [n for n in names if n in (CUSIP_COLUMN, DATE_COLUMN)]
+        missing = [c for c in columns if c not in names]
+        if missing:
+            raise ValueError('Not in ' + str(path) + ': ' + ', '.join(missing))
+        names   = keys + [c for c in columns if c not in keys]
+    where   = []
+    if start is not None:
+        start = _date(start)
+        where += [ds.field('year') >= start.year,
+                  ds.field(DATE_COLUMN) >= pa.scalar(start, pa.date32())]
+    if end is not None:
+        end   = _date(end)
+        where += [ds.field('year') <= end.year,
+                  ds.field(DATE_COLUMN) <= pa.scalar(end, pa.date32())]
+    if cusips is not None:
+        where += [ds.field(CUSIP_COLUMN).isin(pa.array(list(cusips), pa.string()))]
+    expr    = None
+    for e in where:
+        expr = e if expr is None else expr & e
+    frame   = dataset.to_table(columns=names, filter=expr).to_pandas(date_as_object=False)
+    if DATE_COLUMN in frame.columns:
+        frame[DATE_COLUMN] = frame[DATE_COLUMN].astype('datetime64[ns]')
+    # Back from year-major to CUSIP-major #
+    keys    = [c for c in (CUSIP_COLUMN, DATE_COLUMN) if c in frame.columns]
+    return frame.sort_values(keys, kind='stable', ignore_index=True)
@@ -0,0 +1,134 @@
+'''
+Overview
+-------------
+Intraday OHLC / VWAP bars of cleaned trades.
+
+The daily outputs keep equal- and volume-weighted prices and volumes per
+bucket. A bar adds, per CUSIP and bucket of a resolution in
+tracelib.bucketing.RESOLUTIONS:
+
+    prc_open, prc_close     price of the first and last trade
+    prc_high, prc_low       highest and lowest price
+    n_trades                number of trades
+    qvolume                 par volume
+    vwap                    sum of price x volume / volume
+    last_trade              execution time of the last trade
+
+trade_bars() sorts the trades once by CUSIP and execution time (stable,
+so trades at the same time keep their order) and reduces each run of
+equal (CUSIP, bucket) with NumPy segment reductions (ufunc.reduceat) on
+the sorted arrays: first and last element, maximum, minimum and sums. The
+bars of a resolution come out in the same order, so build_bars() makes
+every coarser resolution with the same reductions over the finer bars,
+from one sort and without going back to the trades. Trades without a price, CUSIP or execution time are left out.
+'''
+
+import numpy as np
+import pandas as pd
+
+from tracelib.bucketing import RESOLUTIONS
+
+BAR_COLUMNS = ['prc_open', 'prc_high', 'prc_low', 'prc_close', 'n_trades',
+               'qvolume', 'vwap', 'last_trade']
+
+
+def _segments(codes, start):
+    # First position of every run of equal (code, bucket start) #
+    new = np.ones(len(codes), dtype=bool)
+    new[1:] = (codes[1:] != codes[:-1]) | (start[1:] != start[:-1])
+    return np.flatnonzero(new)
+
+
+def _reduce(codes, start, first, last, high, low, counts, volume, prc_vol, times):
+    # One bar per segment of the sorted arrays #
+    seg = _segments(codes, start)
+    end = np.append(seg[1:], len(codes))[:len(seg)] - 1
+    return {'codes': codes[seg],
+            'start': start[seg],
+            'prc_open': first[seg],
+            'prc_high': np.maximum.reduceat(high, seg),
+            'prc_low': np.minimum.reduceat(low, seg),
+            'prc_close': last[end],
+            'n_trades': np.add.reduceat(counts, seg),
+            'qvolume': np.add.reduceat(volume, seg),
+            'sum_prc_vol': np.add.reduceat(prc_vol, seg),
+            'last_trade': np.maximum.reduceat(times, seg)}
+
+
+def _sorted_trades(trace, time):
+    # Priced trades sorted by CUSIP, then execution time (ns); CUSIP codes
+    # follow the sorted CUSIPs #
+    prc   = trace['rptd_pr'].to_numpy('float64')
+    times = np.asarray(trace[time], dtype='datetime64[ns]')
+    keep  = ~np.isnan(prc) & ~np.isnat(times) & trace['cusip_id'].notna().to_numpy()
+    codes, cusips = pd.factorize(trace['cusip_id'].to_numpy()[keep], sort=True)
+    ns    = times[keep].view('int64')
+    order = np.lexsort((ns, codes))
+    vol   = np.nan_to_num(trace['entrd_vol_qt'].to_numpy('float64')[keep][order])
+    prc   = prc[keep][order]
+    return codes[order].astype('int64'), cusips, ns[order], prc, vol
+
+
+def _bars(trace, resolution, time):
+    codes, cusips, ns, prc, vol = _sorted_trades(trace, time)
+    width = RESOLUTIONS[resolution]
+    bars  = _reduce(codes, ns - ns % width, prc, prc, prc, prc,
+                    np.ones(len(prc), dtype='int64'), vol, prc * vol, ns)
+    return bars, cusips
+
+
+def _roll_up(bars, resolution):
+    width = RESOLUTIONS[resolution]
+    return _reduce(bars['codes'], bars['start'] - bars['start'] % width,
+                   bars['prc_open'], bars['prc_close'], bars['prc_high'],
+                   bars['prc_low'], bars['n_trades'], bars['qvolume'],
+                   bars['sum_prc_vol'], bars['last_trade'])
+
+
+def _frame(bars, cusips, time):
+    index = pd.MultiIndex.from_arrays([cusips.take(bars['codes']),
+                                       bars['start'].view('datetime64[ns]')],
+                                      names=['cusip_id', time])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = np.where(bars['qvolume'] != 0, bars['sum_prc_vol'] / bars['qvolume'], np.nan)
+    frame = pd.DataFrame({'prc_open': bars['prc_open'],
+                          'prc_high': bars['prc_high'],
+                          'prc_low': bars['prc_low'],
+                          'prc_close': bars['prc_close'],
+                          'n_trades': bars['n_trades'].astype('int32'),
+                          'qvolume': bars['qvolume'],
+                          'vwap': vwap,
+                          'last_trade': bars['last_trade'].view('datetime64[ns]')},
+                         index=index)
+    return frame[BAR_COLUMNS]
+
+
+def trade_bars(trace, resolution, time='trd_exctn_dtm'):
+    """BAR_COLUMNS per (cusip_id, bar start) of the cleaned trades in trace."""
+    if resolution not in RESOLUTIONS:
+        raise ValueError('Unknown resolution ' + str(resolution))
+    bars, cusips = _bars(trace, resolution, time)
+    return _frame(bars, cusips, time)
+
+
+def build_bars(trace, resolutions, time='trd_exctn_dtm'):
+    """
+    {resolution: bars} for every resolution, from one sort of the trades;
+    each width must divide the next coarser one.
+    """
+    for r in resolutions:
+        if r not in RESOLUTIONS:
+            raise ValueError('Unknown resolution ' + str(r))
+    order = sorted(set(resolutions), key=RESOLUTIONS.get)
+    for fine, coarse in zip(order, order[1:]):
+        if RESOLUTIONS[coarse] % RESOLUTIONS[fine]:
+            raise ValueError(coarse + ' bars cannot be rolled up from ' + fine)
+    out  = {}
+    bars = None
+    for resolution in order:
+        if bars is None:
+            bars, cusips = _bars(trace, resolution, time)
+        else:
+            bars = _roll_up(bars, resolution)
+        out[resolution] = _frame(bars, cusips, time)
+    return out
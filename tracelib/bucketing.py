@@ -0,0 +1,97 @@
+'''
+Overview
+-------------
+Intraday time buckets of cleaned trades at several resolutions.
+
+The cleaners floored each trade's execution time with one Python call per
+trade (Timestamp.replace). floor_times() floors the whole datetime64
+column at once on its int64 nanoseconds, for any resolution in
+RESOLUTIONS:
+
+    1min, 5min, 15min, hourly, daily
+
+bucket_sums() makes the one pass over the trades: per CUSIP and bucket of
+the finest resolution asked for, it adds up the components of every
+output (tracelib.aggregate.SUM_COLUMNS: price counts and sums, volume,
+price x volume, dollar volume, and the same per side for bid and ask
+prices). roll_up() floors the bucket times of those sums to a coarser
+resolution and adds them, so each coarser panel is built from the finer
+one, never from the trades. panels() turns sums into the Prices, Volumes
+and Illiq frames of the cleaners (tracelib.aggregate.outputs).
+
+bucket_panels() does all of it for a list of resolutions.
+'''
+
+import numpy as np
+import pandas as pd
+
+from tracelib.aggregate import SUM_COLUMNS, components, grouped_sums, outputs
+
+_MINUTE = 60 * 10**9
+
+# Bucket width of each resolution, in nanoseconds #
+RESOLUTIONS = {'1min':   _MINUTE,
+               '5min':   5 * _MINUTE,
+               '15min':  15 * _MINUTE,
+               'hourly': 60 * _MINUTE,
+               'daily':  1440 * _MINUTE}
+
+
+def _width(resolution):
+    if resolution not in RESOLUTIONS:
+        raise ValueError('Unknown resolution ' + str(resolution) + ', expected one of '
+                         + ', '.join(RESOLUTIONS))
+    return RESOLUTIONS[resolution]
+
+
+def floor_times(times, resolution):
+    """datetime64[ns] values floored to the start of their bucket (NaT stays NaT)."""
+    values = np.asarray(times, dtype='datetime64[ns]')
+    ns     = values.view('int64')
+    width  = _width(resolution)
+    out    = ns - ns % width
+    return np.where(np.isnat(values), values, out.view('datetime64[ns]'))
+
+
+def bucket_sums(trace, resolution, time='trd_exctn_dtm'):
+    """
+    SUM_COLUMNS (tracelib.aggregate) per (cusip_id, bucket start) of the
+    trades in trace (cusip_id, time, rptd_pr, entrd_vol_qt, rpt_side_cd).
+    """
+    keys = pd.DataFrame({'cusip_id': trace['cusip_id'].to_numpy(),
+                         time: floor_times(trace[time], resolution)})
+    return grouped_sums(keys, ['cusip_id', time], components(trace))
+
+
+def roll_up(sums, resolution):
+    """Sums of a finer resolution added up into buckets of resolution."""
+    cusip, times = sums.index.names
+    keys = pd.DataFrame({cusip: sums.index.get_level_values(0),
+                         times: floor_times(sums.index.get_level_values(1), resolution)})
+    return grouped_sums(keys, [cusip, times],
+                        {col: sums[col].to_numpy() for col in SUM_COLUMNS})
+
+
+def panels(sums, label):
+    """Prices, Volumes and Illiq frames of sums, indexed (cusip_id, time, agg_level)."""
+    sums = sums.set_index(pd.Index(np.full(len(sums), label, dtype=object),
+                                   name='agg_level'), append=True)
+    return outputs(sums)
+
+
+def bucket_panels(trace, resolutions, time='trd_exctn_dtm'):
+    """
+    {resolution: (Prices, Volumes, Illiq)} for every resolution, from one
+    pass over trace at the finest one. Each width must divide the next
+    coarser one.
+    """
+    order  = sorted(set(resolutions), key=_width)
+    for fine, coarse in zip(order, order[1:]):
+        if _width(coarse) % _width(fine):
+            raise ValueError(coarse + ' buckets cannot be rolled up from ' + fine)
+    out    = {}
+    sums   = None
+    for resolution in order:
+        sums = bucket_sums(trace, resolution, time) if sums is None else roll_up(sums, resolution)
+        out[resolution] = panels(sums, resolution)
+    return out
@@ -0,0 +1,250 @@
+'''
+Overview
+-------------
+Bulk extraction of a whole TRACE table into a RawTraceStore.
+
+For a full rebuild, hundreds of WHERE cusip_id in (...) queries are much
+slower than one export per year. bulk_load() runs
+
+    COPY (SELECT <store columns> FROM <table>
+          WHERE trd_exctn_dt in <year> [AND (<store where>)]) TO STDOUT CSV
+
+over the existing connection, one trade year at a time, and streams the CSV
+through a pipe straight into the store's bucket/year Parquet partitions:
+the export is parsed and written while it is still being transferred, and
+nothing but the current Arrow batch is held in memory. An OfflineConnection
+writes the same CSV from its cursor.
+
+Every finished year is checkpointed in <store>/_bulk.json together with
+its row count and throughput, so an interrupted load resumes at the first
+unfinished year (files of a half-written year are removed first). Once
+every requested year is in, the CUSIPs are marked as held in the store's
+manifest and the cleaners read all their chunks from disk. years must
+therefore cover every trade year in the table; messages without an
+execution date are not loaded. Works for any table with cusip_id and
+trd_exctn_dt, e.g. trace.trace_enhanced or trace_standard.trace.
+'''
+
+import csv
+import glob
+import io
+import json
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+
+from tracelib.connection import OfflineConnection
+from tracelib.store import cusip_bucket
+
+NULL = '\\N'
+
+
+def year_sql(table, columns, year, where=None):
+    """SELECT of one trade year of table."""
+    sql = 'SELECT ' + ','.join(columns) + ' FROM ' + table + \
+          " WHERE trd_exctn_dt >= '" + str(year) + "-01-01'" + \
+          " AND trd_exctn_dt < '" + str(year + 1) + "-01-01'"
+    if where:
+        sql = sql + ' AND (' + where + ')'
+    return sql
+
+
+#* ************************************** */
+#* CSV export                             */
+#* ************************************** */
+class _Counted:
+    # Binary file wrapper counting the bytes written through it #
+    def __init__(self, raw):
+        self.raw    = raw
+        self.nbytes = 0
+
+    def write(self, data):
+        self.nbytes += len(data)
+        return self.raw.write(data)
+
+
+def _copy_csv(db, sql, out):
+    # Write the result of sql as CSV with a header to the binary file out,
+    # NULL written as \N, so an empty field is an empty string #
+    if isinstance(db, OfflineConnection):
+        cur    = db.cursor(sql)
+        text   = io.StringIO()
+        writer = csv.writer(text)
+        try:
+            rows = [[d[0].lower() for d in cur.description]]
+            while rows:
+                writer.writerows([NULL if v is None else v for v in row] for row in rows)
+                out.write(text.getvalue().encode('utf-8'))
+                text.seek(0)
+                text.truncate()
+                rows = cur.fetchmany(100000)
+        finally:
+            cur.close()
+        return
+    # wrds.Connection: COPY over its psycopg2 connection #
+    cur = db.connection.connection.cursor()
+    try:
+        cur.copy_expert('COPY (' + sql + ') TO STDOUT WITH '
+                        "(FORMAT csv, HEADER true, NULL '" + NULL + "')", out)
+    finally:
+        cur.close()
+
+
+#* ************************************** */
+#* Arrow conversion                       */
+#* ************************************** */
+def _cast(arr, typ):
+    if pa.types.is_string(typ):
+        return arr
+    # Empty text in a typed column is missing #
+    arr = pc.if_else(pc.equal(arr, ''), pa.scalar(None, pa.string()), arr)
+    # TRACE times are whole seconds and dates carry no time of day #
+    if pa.types.is_time(typ):
+        arr = pc.utf8_slice_codeunits(arr, 0, 8)
+        return pc.strptime(arr, format='%H:%M:%S', unit='us').cast(pa.time64('us')).cast(typ)
+    if pa.types.is_date(typ):
+        return pc.utf8_slice_codeunits(arr, 0, 10).cast(typ)
+    return arr.cast(typ)
+
+
+def _store_schema(store):
+    # The store's schema (tracelib.store.store_schema if it is new) #
+    with store._lock:
+        return store._schema()
+
+
+#* ************************************** */
+#* Load                                   */
+#* ************************************** */
+def _load_year(db, store, year, schema, keep, held):
+    sql    = year_sql(store.table, store.columns, year, store.where)
+    token  = 'bulk-' + str(year) + '-' + uuid.uuid4().hex
+    counts = pd.Series(dtype='int64')
+    r, w   = os.pipe()
+    sink   = _Counted(os.fdopen(w, 'wb'))
+    failed = []
+
+    def _export():
+        try:
+            _copy_csv(db, sql, sink)
+        except BaseException as e:
+            failed.append(e)
+        finally:
+            try:
+                sink.raw.close()
+            except OSError:
+                pass
+
+    def _batches(reader):
+        nonlocal counts
+        for batch in reader:
+            cusip = batch.column('cusip_id')
+            mask  = pc.invert(pc.is_in(cusip, value_set=held))
+            if keep is not None:
+                mask = pc.and_(mask, pc.is_in(cusip, value_set=keep))
+            batch = batch.filter(mask)
+            if not batch.num_rows:
+                continue
+            codes, uniques = pd.factorize(batch.column('cusip_id').to_numpy(zero_copy_only=False))
+            counts = counts.add(pd.Series(np.bincount(codes), index=uniques), fill_value=0)
+            arrays = [_cast(batch.column(f.name), f.type) for f in schema]
+            arrays.append(pa.array(cusip_bucket(uniques, store.n_buckets)[codes]))
+            arrays.append(pa.array(np.full(batch.num_rows, year, dtype='int32')))
+            yield pa.RecordBatch.from_arrays(arrays, schema=full)
+
+    full   = schema.append(pa.field('bucket', pa.int32())).append(pa.field('year', pa.int32()))
+    start  = time.time()
+    worker = threading.Thread(target=_export, daemon=True)
+    worker.start()
+    source = os.fdopen(r, 'rb')
+    try:
+        reader = pv.open_csv(source,
+                             read_options=pv.ReadOptions(block_size=64 << 20),
+                             convert_options=pv.ConvertOptions(
+                                 column_types={c: pa.string() for c in store.columns},
+                                 null_values=[NULL],
+                                 strings_can_be_null=True))
+        ds.write_dataset(_batches(reader), store.root, schema=full, format='parquet',
+                         partitioning=ds.partitioning(
+                             pa.schema([('bucket', pa.int32()), ('year', pa.int32())]),
+                             flavor='hive'),
+                         basename_template=token + '-{i}.parquet',
+                         existing_data_behavior='overwrite_or_ignore')
+    except BaseException:
+        # A failed export shows up here as a truncated CSV: report its error #
+        source.close()
+        worker.join()
+        if failed:
+            raise failed[0]
+        raise
+    source.close()
+    worker.join()
+    if failed:
+        raise failed[0]
+    seconds = time.time() - start
+    counts  = counts.astype('int64')
+    return counts, {'rows': int(counts.sum()),
+                    'mb': round(sink.nbytes / 2**20, 1),
+                    'seconds': round(seconds, 1),
+                    'rows_per_s': int(counts.sum() / max(seconds, 1e-9)),
+                    'mb_per_s': round(sink.nbytes / 2**20 / max(seconds, 1e-9), 1)}
+
+
+def bulk_load(db, store, years, cusips=None):
+    """
+    Fill store with every message of years, one COPY per year, keeping only
+    cusips if given and skipping CUSIPs the store already holds. Resumes
+    from <store>/_bulk.json and returns the per-year throughput report.
+    """
+    years = [int(y) for y in years]
+    path  = os.path.join(store.root, '_bulk.json')
+    state = {'table': store.table, 'where': store.where, 'years': {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+        if state['table'] != store.table or state['where'] != store.where:
+            raise ValueError('Bulk load in ' + store.root + ' was started for '
+                             'another table or where clause')
+
+    schema = _store_schema(store)
+    keep   = pa.array(list(cusips), pa.string()) if cusips is not None else None
+    held   = pa.array(list(store.manifest['cusip_id']), pa.string())
+    for year in years:
+        if str(year) in state['years']:
+            print(store.table, year, 'done')
+            continue
+        # Remove the files of an interrupted attempt at this year #
+        for part in glob.glob(os.path.join(store.root, 'bucket=*', 'year=' + str(year), 'bulk-*')):
+            os.remove(part)
+        counts, report = _load_year(db, store, year, schema, keep, held)
+        counts.rename_axis('cusip_id').rename('n_msgs').reset_index() \
+              .to_parquet(os.path.join(store.root, '_bulk_counts_' + str(year) + '.parquet'),
+                          index=False)
+        state['years'][str(year)] = report
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f, indent=1)
+        os.replace(tmp, path)
+        print(store.table, year, report['rows'], 'rows', report['mb'], 'MB',
+              report['seconds'], 's', report['rows_per_s'], 'rows/s',
+              report['mb_per_s'], 'MB/s')
+
+    # All years in: the loaded CUSIPs are held in full #
+    parts  = [pd.read_parquet(os.path.join(store.root, '_bulk_counts_' + str(y) + '.parquet'))
+              for y in years]
+    counts = pd.concat(parts).groupby('cusip_id')['n_msgs'].sum() if parts \
+             else pd.Series(dtype='int64')
+    loaded = list(cusips) if cusips is not None else list(counts.index)
+    warm   = set(store.warm_cusips(loaded))
+    new    = [c for c in loaded if c not in warm]
+    store.mark(new, counts)
+    return pd.DataFrame.from_dict({int(y): state['years'][str(y)] for y in years},
+                                  orient='index')
@@ -0,0 +1,207 @@
+'''
+Overview
+-------------
+Database connection used by every stage.
+
+connect() returns wrds.Connection() unless an offline database is given,
+either as an argument or through the TRACE_OFFLINE_DB environment
+variable. The offline database is a local DuckDB (.duckdb) or SQLite
+(.sqlite, .db) file holding copies of the WRDS tables the scripts query,
+and OfflineConnection answers the same raw_sql(sql, params=...) calls
+against it. Stages can then be run, profiled and benchmarked against fixed
+fixtures without network access or WRDS credentials.
+
+Tables are stored under their WRDS name with the schema dot replaced by a
+double underscore (trace.trace_enhanced is trace__trace_enhanced), so the
+same file layout works in both engines. WRDS aliases of a table (ALIASES,
+e.g. trace_enhanced.trace_enhanced) read the same local table. snapshot() copies the rows of a
+list of CUSIPs from a live WRDS connection into such a file, and
+write_tables() writes any DataFrames (for example synthetic data) into one.
+'''
+
+import os
+import re
+import sqlite3
+
+import pandas as pd
+
+OFFLINE_DB_ENV = 'TRACE_OFFLINE_DB'
+
+# WRDS tables queried by the scripts #
+TABLES = ['trace.trace_enhanced', 'trace_standard.trace',
+          'trace_standard.trace_btds144a', 'fisd.fisd_mergedissue',
+          'fisd.fisd_mergedissuer', 'fisd.fisd_ratings', 'crsp.tfz_idx',
+          'crsp.tfz_mth_ft', 'wrdsapps.bondret']
+
+# Other WRDS names of the same tables (library alias) #
+ALIASES = {'trace_enhanced.trace_enhanced': 'trace.trace_enhanced'}
+
+_PARAM = re.compile(r'%\((\w+)\)s')
+
+
+def local_name(table):
+    """Name of a WRDS table (schema.table) in the offline database."""
+    return table.replace('.', '__')
+
+
+def _engine(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.duckdb':
+        return 'duckdb'
+    if ext in ('.sqlite', '.sqlite3', '.db'):
+        return 'sqlite'
+    raise ValueError('Offline database must be a .duckdb, .sqlite or .db file, got ' + path)
+
+
+def _open(path, read_only=False):
+    if _engine(path) == 'duckdb':
+        import duckdb
+        return duckdb.connect(path, read_only=read_only)
+    return sqlite3.connect(path, check_same_thread=False)
+
+
+def connect(offline_db=None):
+    """
+    WRDS connection, or an OfflineConnection when offline_db (or the
+    TRACE_OFFLINE_DB environment variable) names a local database.
+    """
+    offline_db = offline_db or os.environ.get(OFFLINE_DB_ENV)
+    if offline_db:
+        return OfflineConnection(offline_db)
+    import wrds
+    return wrds.Connection()
+
+
+#* ************************************** */
+#* Offline connection                     */
+#* ************************************** */
+def translate(sql, params=None):
+    """
+    Rewrite a WRDS query for the offline database: WRDS table names become
+    local names and psycopg2 %(name)s parameters become ? placeholders, a
+    tuple or list expanding to one placeholder per element the way psycopg2
+    renders it for IN. Returns the query and its positional arguments.
+    """
+    names = dict({t: t for t in TABLES}, **ALIASES)
+    for table, target in names.items():
+        sql = re.sub(r'\b' + re.escape(table) + r'\b', local_name(target), sql,
+                     flags=re.I)
+    args = []
+
+    def _bind(match):
+        if params is None or match.group(1) not in params:
+            raise ValueError('No value for query parameter ' + match.group(1))
+        value = params[match.group(1)]
+        if isinstance(value, (tuple, list)):
+            args.extend(value)
+            # psycopg2 would send an empty IN list as a syntax error #
+            return '(' + ', '.join('?' * len(value)) + ')' if value else '(NULL)'
+        args.append(value)
+        return '?'
+
+    sql = _PARAM.sub(_bind, sql).replace('%%', '%')
+    return sql, args
+
+
+class OfflineConnection:
+    """
+    Stand-in for wrds.Connection on a local DuckDB or SQLite file.
+
+    raw_sql takes the arguments the scripts pass to wrds raw_sql. Column
+    names come back in lower case, as PostgreSQL returns unquoted
+    identifiers.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise ValueError('Offline database ' + path + ' does not exist')
+        self.path   = path
+        self.kind   = _engine(path)
+        self._con   = _open(path, read_only=True)
+
+    def cursor(self, sql, params=None):
+        """DB-API cursor on which the translated query has been executed."""
+        sql, args = translate(sql, params)
+        cur = self._con.cursor()
+        try:
+            cur.execute(sql, args)
+        except BaseException:
+            cur.close()
+            raise
+        return cur
+
+    def raw_sql(self, sql, coerce_float=True, date_cols=None, index_col=None,
+                params=None):
+        cur = self.cursor(sql, params)
+        try:
+            cols = [d[0].lower() for d in cur.description]
+            data = pd.DataFrame.from_records(cur.fetchall(), columns=cols,
+                                             coerce_float=coerce_float)
+        finally:
+            cur.close()
+        for col in date_cols or []:
+            data[col] = pd.to_datetime(data[col])
+        if index_col is not None:
+            data = data.set_index(index_col)
+        return data
+
+    def close(self):
+        self._con.close()
+
+
+#* ************************************** */
+#* Fixtures                               */
+#* ************************************** */
+def write_tables(path, frames):
+    """Write {WRDS table name: DataFrame} into the offline database at path."""
+    con = _open(path)
+    try:
+        for table, frame in frames.items():
+            name = local_name(table)
+            if _engine(path) == 'duckdb':
+                con.register('_frame', frame)
+                con.execute('CREATE OR REPLACE TABLE ' + name + ' AS SELECT * FROM _frame')
+                con.unregister('_frame')
+            else:
+                frame.to_sql(name, con, if_exists='replace', index=False)
+        if _engine(path) == 'sqlite':
+            con.commit()
+    finally:
+        con.close()
+
+
+def _pull_in(db, table, column, values, chunk_size=1000):
+    values = list(dict.fromkeys(v for v in values if v is not None and not pd.isna(v)))
+    parts  = [db.raw_sql('SELECT * FROM ' + table + ' WHERE ' + column +
+                         ' in %(values)s',
+                         params={'values': tuple(values[i:i + chunk_size])})
+              for i in range(0, len(values), chunk_size)]
+    if not parts:
+        # Nothing to match: keep the table's columns #
+        return db.raw_sql('SELECT * FROM ' + table + ' WHERE 1 = 0')
+    rows   = [p for p in parts if len(p)]
+    return pd.concat(rows, ignore_index=True) if rows else parts[0]
+
+
+def snapshot(db, path, cusips):
+    """
+    Copy every table in TABLES from the live connection db into the offline
+    database at path, keeping only the rows of the given 9-digit CUSIPs
+    (and their FISD issuers and ratings). The CRSP treasury tables are
+    small and copied in full.
+    """
+    cusips = list(cusips)
+    frames = {}
+    for table in ['trace.trace_enhanced', 'trace_standard.trace',
+                  'trace_standard.trace_btds144a']:
+        frames[table] = _pull_in(db, table, 'cusip_id', cusips)
+    issue = _pull_in(db, 'fisd.fisd_mergedissue', 'complete_cusip', cusips)
+    frames['fisd.fisd_mergedissue']  = issue
+    frames['fisd.fisd_mergedissuer'] = _pull_in(db, 'fisd.fisd_mergedissuer',
+                                                'issuer_id', issue.get('issuer_id', []))
+    frames['fisd.fisd_ratings']      = _pull_in(db, 'fisd.fisd_ratings',
+                                                'issue_id', issue.get('issue_id', []))
+    frames['wrdsapps.bondret']       = _pull_in(db, 'wrdsapps.bondret', 'cusip', cusips)
+    for table in ['crsp.tfz_idx', 'crsp.tfz_mth_ft']:
+        frames[table] = db.raw_sql('SELECT * FROM ' + table)
+    write_tables(path, frames)
@@ -0,0 +1,249 @@
+'''
+Overview
+-------------
+Dick-Nielsen (2009, 2014) cleaning of TRACE Enhanced messages.
+
+The cancellation, correction and reversal matching used to be pasted into
+every cleaning script. It lives here once, as pure functions of a chunk of
+messages:
+
+    clean_post_2012(post)   X/C cancellations and corrections, Y reversals
+                            (messages reported on or after 2012-02-06)
+    clean_pre_2012(pre)     C cancellations, W correction chains, and
+                            as-of R reversals matched on six keys
+    clean_enhanced(trace)   both, on the messages of either period
+
+The functions do not modify their input and work on raw chunks as well as
+on chunks typed by tracelib.schema.ingest. Scripts that filter only the
+pre-2012 messages (the standard TRACE cleaners) use split_2012() and the
+two period functions directly.
+
+Cleaned chunks are the same as the scripts produced, except for long
+pre-2012 correction chains (below). The cancellation and correction
+matches are anti-joins on integer row keys (tracelib.keys) rather than
+left merges, and duplicate messages are dropped on the msg_fp fingerprint
+that tracelib.schema.ingest adds (tracelib.fingerprint) rather than on all
+columns.
+
+resolve_w_chains() treats each W record as an edge msg_seq_nb ->
+orig_msg_seq_nb within a (cusip_id, trd_exctn_dt) and keeps the last W of
+every chain, pointed at the trade report the chain starts from. The
+scripts resolved chains per execution time stamp with napp / ntype counts
+and a pivot, which gives the same result for chains of one or two W
+records at one time stamp but lost the chain when a W changed the
+execution time, or when a time stamp held several chains of three or more
+records.
+
+The pre-2012 as-of reversal match numbers reversals and trade reports
+within their keys from one lexsort of integer keys
+(tracelib.keys.within_sequence) and anti-joins on (six keys, number),
+instead of sorting, numbering and merging two header frames.
+
+The scripts' post-2012 reversal step filtered on the cancellation match,
+so a Y record drops out of the sample itself but does not remove the
+trade it reverses; reversals=True removes it.
+'''
+
+import numpy as np
+import pandas as pd
+
+from tracelib.filters import POST_2012_DATE
+from tracelib.fingerprint import unique
+from tracelib.instrument import stage
+from tracelib.keys import frame_keys, row_keys, unmatched, within_sequence
+
+# Keys matching a post-2012 X/C/Y record to its trade report #
+POST_KEYS = ['cusip_id', 'trd_exctn_dt', 'trd_exctn_tm', 'rptd_pr',
+             'entrd_vol_qt', 'rpt_side_cd', 'cntra_mp_id']
+
+# Keys matching a pre-2012 C record to its trade report #
+PRE_KEYS  = ['cusip_id', 'trd_exctn_dt', 'trd_exctn_tm', 'rptd_pr',
+             'entrd_vol_qt', 'trd_rpt_dt']
+
+# Six keys matching a pre-2012 as-of reversal (no execution time) #
+REV_KEYS  = ['cusip_id', 'bond_sym_id', 'trd_exctn_dt', 'entrd_vol_qt',
+             'rptd_pr', 'rpt_side_cd', 'cntra_mp_id']
+
+# Order in which reversals and trades are numbered within REV_KEYS #
+REV_ORDER = ['trd_exctn_tm', 'trd_rpt_dt', 'trd_rpt_tm']
+
+# Fields identifying a pre-2012 trade record #
+TRADE_KEYS = ['cusip_id', 'trd_exctn_dt', 'trd_exctn_tm', 'entrd_vol_qt',
+              'rptd_pr', 'rpt_side_cd', 'cntra_mp_id', 'msg_seq_nb',
+              'trd_rpt_dt', 'trd_rpt_tm']
+
+_W_KEYS   = ['cusip_id', 'trd_exctn_dt', 'trd_exctn_tm']
+
+
+def split_2012(trace):
+    """(pre, post): messages reported before / from 2012-02-06, with a CUSIP."""
+    named = trace['cusip_id'] != ''
+    pre   = trace[named & (trace['trd_rpt_dt'] <  POST_2012_DATE)]
+    post  = trace[named & (trace['trd_rpt_dt'] >= POST_2012_DATE)]
+    return pre, post
+
+
+#* ************************************** */
+#* Post 2012-02-06                        */
+#* ************************************** */
+def clean_post_2012(post, reversals=False, log=None):
+    """
+    Trade reports of post after removing cancellations and corrections.
+    reversals=True also removes the trade reports reversed by a Y record.
+    log (a tracelib.instrument.StageLog) times each step.
+    """
+    post_tr = unique(post[(post['trc_st'] == 'T') | (post['trc_st'] == 'R')])
+    post_xc = post[(post['trc_st'] == 'X') | (post['trc_st'] == 'C')]
+    post_y  = post[(post['trc_st'] == 'Y')]
+
+    # 1.1 Cancellations and corrections: the 7 keys, and X and C records
+    # show the same msg_seq_nb as the original record #
+    with stage(log, 'post_xc_cancel', len(post_tr)) as s:
+        clean_post = post_tr[unmatched(post_tr, post_xc, POST_KEYS + ['msg_seq_nb'])]
+        s.rows_out = len(clean_post)
+
+    # 1.2 Reversals: the 7 keys, and Y records show the original msg_seq_nb
+    # as orig_msg_seq_nb. The scripts filtered this match on the
+    # cancellation match above, so by default it removes nothing #
+    if reversals:
+        with stage(log, 'post_y_reversal', len(clean_post)) as s:
+            clean_post = clean_post[unmatched(clean_post, post_y,
+                                              POST_KEYS + ['msg_seq_nb'],
+                                              POST_KEYS + ['orig_msg_seq_nb'])]
+            s.rows_out = len(clean_post)
+    return clean_post.reset_index(drop=True)
+
+
+#* ************************************** */
+#* Pre 2012-02-06                         */
+#* ************************************** */
+def _cancel_pre(pre_t, pre_c):
+    # 2.1 C records show orig_msg_seq_nb matching the original msg_seq_nb #
+    pre_t = unique(pre_t)
+    return pre_t[unmatched(pre_t, pre_c, PRE_KEYS + ['msg_seq_nb'],
+                           PRE_KEYS + ['orig_msg_seq_nb'])]
+
+
+def resolve_w_chains(pre_w):
+    """
+    The surviving W record of every correction chain in pre_w, with
+    orig_msg_seq_nb set to the trade report the chain corrects.
+    """
+    # Each W record is an edge msg_seq_nb -> orig_msg_seq_nb between nodes
+    # (cusip_id, trd_exctn_dt, sequence number). A node with no outgoing
+    # edge starts a chain (the corrected trade report); a W that no other W
+    # points to ends one (the last correction) #
+    day       = ['cusip_id', 'trd_exctn_dt']
+    own, orig = row_keys(pre_w, pre_w, day + ['msg_seq_nb'], day + ['orig_msg_seq_nb'])
+    n         = len(pre_w)
+    codes, _  = pd.factorize(np.concatenate([own, orig]))
+    own, orig = codes[:n], codes[n:]
+    m         = int(codes.max()) + 1 if n else 0
+    parent    = np.arange(m)
+    parent[own] = orig
+
+    # Pointer jumping: every round links each node to its grandparent, so
+    # all nodes reach the start of their chain in log2(chain length)
+    # rounds. The bound stops on a cycle, which has no start #
+    for _ in range(max(m, 1).bit_length() + 1):
+        grand = parent[parent]
+        if (grand == parent).all():
+            break
+        parent = grand
+
+    pointed = np.zeros(m, dtype=bool)
+    pointed[orig[orig != own]] = True
+    last    = ~pointed[own]
+
+    # Sequence number of each node, taken where it first appears: factorize
+    # numbers nodes in order of first appearance #
+    seq   = pd.concat([pre_w['msg_seq_nb'], pre_w['orig_msg_seq_nb']], ignore_index=True)
+    first = np.flatnonzero(np.r_[True, codes[1:] > np.maximum.accumulate(codes)[:-1]]) \
+            if n else np.zeros(0, dtype='int64')
+
+    w_clean = pre_w[last].copy()
+    w_clean['orig_msg_seq_nb'] = seq.iloc[first[parent[own[last]]]].to_numpy()
+    w_clean = w_clean.sort_values(by = _W_KEYS, kind = 'stable')
+    return w_clean.drop_duplicates(subset = ['orig_msg_seq_nb'] + _W_KEYS + ['msg_seq_nb'])
+
+
+def _correct_pre(clean_pre1, w_clean):
+    # 2.2.7 W records show orig_msg_seq_nb matching the original msg_seq_nb:
+    # drop the matched T records and put the W records in their place #
+    day        = ['cusip_id', 'trd_exctn_dt']
+    clean_pre1 = unique(clean_pre1)
+    kept       = unmatched(clean_pre1, w_clean, day + ['msg_seq_nb'], day + ['orig_msg_seq_nb'])
+    used       = ~unmatched(w_clean, clean_pre1[~kept], day + ['orig_msg_seq_nb'],
+                            day + ['msg_seq_nb'])
+
+    rep_w = unique(w_clean)
+    rep_w = rep_w[~unmatched(rep_w, w_clean[used], day + ['msg_seq_nb'])]
+    rep_w = rep_w.drop_duplicates(subset = ['cusip_id', 'trd_exctn_dt', 'msg_seq_nb',
+                                            'orig_msg_seq_nb', 'rptd_pr', 'entrd_vol_qt'])
+    return pd.concat([clean_pre1[kept], rep_w], axis = 0)
+
+
+def _reverse_pre(clean_pre3):
+    # 2.3 As-of reversals (asof_cd = 'R'). Reversals and the records that are
+    # not R (reversal), X (delayed reversal) or D (delayed dissemination)
+    # are numbered 1, 2, ... within the seven REV_KEYS in execution and
+    # report time order; the n-th reversal of the six keys without
+    # bond_sym_id removes the n-th record. Records with a missing key are
+    # not numbered: they are never reversed and reverse nothing #
+    asof    = clean_pre3['asof_cd']
+    rev     = (asof == 'R').to_numpy()
+    keep    = (~asof.isin(['R', 'X', 'D'])).to_numpy()
+    group   = frame_keys(clean_pre3, REV_KEYS)
+    loose   = clean_pre3[REV_KEYS].isna().any(axis = 1).to_numpy()
+    seq_rev = within_sequence(group[rev],
+                              frame_keys(clean_pre3, REV_ORDER, sort = True)[rev])
+    seq     = within_sequence(group[keep],
+                              frame_keys(clean_pre3, REV_ORDER + ['msg_seq_nb'], sort = True)[keep])
+    seq_rev[loose[rev]] = 0
+    seq[loose[keep]]    = 0
+
+    # Anti-join on (six keys, number) #
+    six     = frame_keys(clean_pre3, [k for k in REV_KEYS if k != 'bond_sym_id'])
+    width   = max(seq_rev.max(initial = 0), seq.max(initial = 0)) + 1
+    alive   = ~np.isin(six[keep] * width + seq, six[rev] * width + seq_rev) | loose[keep]
+
+    # A record survives when any record with the same trade fields does;
+    # records with the same trade fields stay together, as in a merge #
+    trade, _ = pd.factorize(frame_keys(clean_pre3, TRADE_KEYS)[keep])
+    survive  = np.isin(trade, trade[alive])
+    rows     = np.flatnonzero(keep)[survive]
+    rows     = rows[np.argsort(trade[survive], kind = 'stable')]
+    return unique(clean_pre3.iloc[rows]).reset_index(drop = True)
+
+
+def clean_pre_2012(pre, log=None):
+    """
+    Trade reports of pre after removing cancellations, corrections and
+    reversals; log (a tracelib.instrument.StageLog) times each step.
+    """
+    pre_c = pre[pre['trc_st'] == 'C']
+    pre_w = pre[pre['trc_st'] == 'W']
+    pre_t = pre[pre['trc_st'] == 'T']
+    with stage(log, 'pre_c_cancel', len(pre_t)) as s:
+        clean_pre1 = _cancel_pre(pre_t, pre_c)
+        s.rows_out = len(clean_pre1)
+    with stage(log, 'pre_w_chains', len(clean_pre1)) as s:
+        clean_pre3 = _correct_pre(clean_pre1, resolve_w_chains(pre_w))
+        s.rows_out = len(clean_pre3)
+    with stage(log, 'pre_asof_reversal', len(clean_pre3)) as s:
+        clean_pre5 = _reverse_pre(clean_pre3)
+        s.rows_out = len(clean_pre5)
+    return clean_pre5
+
+
+def clean_enhanced(trace, columns=None, reversals=False, log=None):
+    """
+    Cleaned trade reports of a chunk of either period, pre-2012 first, with
+    the given columns (default: those of trace) and a fresh index.
+    reversals is passed to clean_post_2012, log to both period functions.
+    """
+    columns   = list(trace.columns) if columns is None else list(columns)
+    pre, post = split_2012(trace)
+    post      = clean_post_2012(post, reversals, log)[columns]
+    pre       = clean_pre_2012(pre, log)[columns]
+    return pd.concat([pre, post], ignore_index=True)
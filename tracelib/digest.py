@@ -0,0 +1,149 @@
+'''
+Overview
+-------------
+Detection of CUSIPs whose raw TRACE history was revised on WRDS.
+
+WRDS occasionally rewrites messages already in trace_enhanced. A digest
+summarizes the messages of one CUSIP that a run pulls (same table and
+where clause):
+
+    n_msgs      number of messages
+    msg_hash    sum over messages of a 32-bit hash of
+                (msg_seq_nb, trc_st, rptd_pr)
+
+A message added, removed or changed in any of those three fields changes
+the digest. server_digests() computes it on the database, one SELECT ...
+GROUP BY cusip_id query per block of CUSIPs, so only one row per CUSIP is
+transferred. The row hash is md5 on WRDS (PostgreSQL) and hash() on an
+offline DuckDB file; digests are only ever compared with digests from the
+same database.
+
+Digests keeps, in a CSV file, the digest of every CUSIP as of the run that
+last cleaned it. changed() lists the CUSIPs whose current digest differs
+(or that have none), the run re-cleans the full history of those CUSIPs
+only, and splice() replaces all their rows in the existing daily files.
+A chunk too small to clean is committed with cleaned=False: its digests
+are recorded, so it is not pulled again on every run, and its existing
+rows are kept.
+The digest is read before the messages are pulled, so a revision landing
+in between is seen as a change by the next run, never missed.
+'''
+
+import os
+import threading
+
+import pandas as pd
+
+from tracelib.extract import ENHANCED_TABLE
+
+DIGEST_COLUMNS = ['msg_seq_nb', 'trc_st', 'rptd_pr']
+
+_TUPLE = " || '|' || ".join('coalesce(CAST(' + c + " AS varchar), '')"
+                            for c in DIGEST_COLUMNS)
+
+# 32-bit hash of the message tuple, per database engine #
+ROW_HASH = {'postgres': "CAST(CAST('x' || substr(md5(" + _TUPLE + "), 1, 8) AS bit(32)) AS bigint)",
+            'duckdb':   'hash(' + _TUPLE + ') %% 4294967296'}
+
+
+def engine(db):
+    """Engine behind a connection: 'postgres' for WRDS, else the offline kind."""
+    return getattr(db, 'kind', 'postgres')
+
+
+def digest_sql(table=ENHANCED_TABLE, where=None, kind='postgres'):
+    """Digest per CUSIP for a block of CUSIPs bound through %(cusip_id)s."""
+    if kind not in ROW_HASH:
+        raise ValueError('No message digest for a ' + str(kind) + ' database')
+    sql = 'SELECT cusip_id, count(*) AS n_msgs, CAST(sum(' + ROW_HASH[kind] + \
+          ') AS bigint) AS msg_hash FROM ' + table + ' WHERE cusip_id in %(cusip_id)s'
+    if where:
+        sql = sql + ' AND (' + where + ')'
+    return sql + ' GROUP BY cusip_id'
+
+
+def server_digests(db, cusips, table=ENHANCED_TABLE, where=None, block=5000):
+    """
+    Frame of n_msgs and msg_hash per CUSIP (both 0 for none), indexed like
+    cusips.
+    """
+    cusips  = list(cusips)
+    digests = pd.DataFrame(0, index=pd.Index(cusips, name='cusip_id'),
+                           columns=['n_msgs', 'msg_hash'], dtype='int64')
+    sql     = digest_sql(table, where, engine(db))
+    for i in range(0, len(cusips), block):
+        found = db.raw_sql(sql, params={'cusip_id': tuple(cusips[i:i + block])})
+        if len(found):
+            found = found.set_index('cusip_id')[['n_msgs', 'msg_hash']].astype('int64')
+            digests.loc[found.index] = found.to_numpy()
+    return digests
+
+
+class Digests:
+    """Per-CUSIP digest file plus the change list and splice of one run."""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            self.digests = pd.read_csv(path, index_col='cusip_id',
+                                       dtype={'cusip_id': str, 'n_msgs': 'int64',
+                                              'msg_hash': 'int64'})
+        else:
+            self.digests = pd.DataFrame({'n_msgs': pd.Series(dtype='int64'),
+                                         'msg_hash': pd.Series(dtype='int64')},
+                                        index=pd.Index([], name='cusip_id', dtype=object))
+        # CUSIPs committed in this run and their digest, and those of them
+        # whose rows splice() replaces #
+        self._done    = {}
+        self._cleaned = set()
+        self._lock = threading.Lock()
+
+    def changed(self, current):
+        """CUSIPs of current (server_digests) whose digest differs or is not stored."""
+        old  = self.digests.reindex(current.index)
+        same = (old == current).all(axis=1)
+        return list(current.index[~same.to_numpy()])
+
+    def revised(self, current):
+        """CUSIPs of current with a stored digest that differs."""
+        return self.changed(current[current.index.isin(self.digests.index)])
+
+    #* ************************************** */
+    #* Commit / splice / save                 */
+    #* ************************************** */
+    def commit(self, cusips, current, cleaned=True):
+        """
+        Record the digests of a chunk; with cleaned=False (a skipped chunk)
+        splice() keeps its existing rows.
+        """
+        rows = current.reindex(list(cusips)).fillna(0).astype('int64')
+        with self._lock:
+            for c, n, h in zip(rows.index, rows['n_msgs'], rows['msg_hash']):
+                self._done[c] = (n, h)
+            if cleaned:
+                self._cleaned.update(rows.index)
+
+    def splice(self, path, tail):
+        """
+        Replace every row of the cleaned CUSIPs in the daily file at path
+        (indexed by cusip_id, trd_exctn_dt) with tail.
+        """
+        if not os.path.exists(path):
+            return tail
+        # CUSIPs stay strings (037833100 would parse as an int) #
+        head = pd.read_csv(path, compression='gzip', index_col=[0, 1],
+                           parse_dates=[1], dtype={'cusip_id': str})
+        drop = head.index.get_level_values(0).isin(list(self._cleaned))
+        return pd.concat([head[~drop], tail]).sort_index()
+
+    def save(self):
+        """Write the digests, keeping those of CUSIPs not cleaned in this run."""
+        done = pd.DataFrame.from_dict(self._done, orient='index',
+                                      columns=['n_msgs', 'msg_hash'], dtype='int64')
+        kept = self.digests[~self.digests.index.isin(done.index)]
+        digests = pd.concat([kept, done]) if len(kept) else done
+        digests.index.name = 'cusip_id'
+        tmp = self.path + '.tmp'
+        digests.reset_index().to_csv(tmp, index=False)
+        os.replace(tmp, self.path)
+        self.digests = digests
@@ -0,0 +1,30 @@
+'''
+Overview
+-------------
+SQL used to pull raw TRACE messages from WRDS, one CUSIP chunk at a time.
+'''
+
+# Columns pulled from trace_enhanced by the intraday-to-daily cleaners #
+ENHANCED_COLUMNS = ['cusip_id', 'bond_sym_id', 'trd_exctn_dt', 'trd_exctn_tm',
+                    'days_to_sttl_ct', 'lckd_in_ind', 'wis_fl', 'sale_cndtn_cd',
+                    'msg_seq_nb', 'trc_st', 'trd_rpt_dt', 'trd_rpt_tm',
+                    'entrd_vol_qt', 'rptd_pr', 'yld_pt', 'asof_cd',
+                    'orig_msg_seq_nb', 'rpt_side_cd', 'cntra_mp_id']
+
+ENHANCED_TABLE = 'trace.trace_enhanced'
+
+
+def chunk_sql(table=ENHANCED_TABLE, columns=ENHANCED_COLUMNS, where=None):
+    """SELECT for one CUSIP chunk, bound through %(cusip_id)s."""
+    sql = 'SELECT ' + ','.join(columns) + ' FROM ' + table + \
+          ' WHERE cusip_id in %(cusip_id)s'
+    if where:
+        sql = sql + ' AND (' + where + ')'
+    return sql
+
+
+def fetch_chunk(db, cusips, table=ENHANCED_TABLE, columns=ENHANCED_COLUMNS,
+                where=None):
+    """Pull all messages for a list of CUSIPs with db.raw_sql."""
+    parm = {'cusip_id': tuple(cusips)}
+    return db.raw_sql(chunk_sql(table, columns, where), params=parm)
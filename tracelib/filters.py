@@ -0,0 +1,165 @@
+'''
+Overview
+-------------
+Trade-level TRACE filters written once and used in two places.
+
+A FilterSpec is a list of Rules. to_sql() compiles it to a WHERE clause
+that is pushed down into the WRDS query, and mask() compiles it to the
+equivalent boolean mask on a chunk that is already in memory. Both follow
+the scripts' handling of missing values: a NULL indicator is read as the
+string 'None' (what .astype('str') turns it into), and a NULL volume or
+price fails its comparison.
+
+The scripts apply these filters to every message, including the X/C/Y and
+C/W records, before cancellations and corrections are matched. The query
+therefore returns exactly the messages the matching step sees, and nothing
+else has to be transferred.
+'''
+
+import numpy as np
+import pandas as pd
+
+from tracelib.extract import ENHANCED_COLUMNS, fetch_chunk
+from tracelib.instrument import stage
+
+# Date from which TRACE Enhanced uses the post-2012 reporting format #
+POST_2012_DATE = '2012-02-06'
+
+_SQL_OPS = {'>=': '>=', '>': '>', '<': '<', '<=': '<='}
+
+
+class Rule:
+    """
+    One trade filter on a single column.
+
+    op is 'in' or 'not_in' (values is a list of strings) or a comparison
+    ('>=', '>', '<', '<=') against a single number. keep_null decides
+    whether a NULL value passes. scope='pre2012' applies the rule only to
+    messages reported before 2012-02-06 and passes the rest.
+    """
+
+    def __init__(self, column, op, values, keep_null=False, scope='all'):
+        if op not in ('in', 'not_in') and op not in _SQL_OPS:
+            raise ValueError('Unknown filter op ' + str(op))
+        if scope not in ('all', 'pre2012'):
+            raise ValueError('Unknown filter scope ' + str(scope))
+        self.column    = column
+        self.op        = op
+        self.values    = values
+        self.keep_null = keep_null
+        self.scope     = scope
+
+    @property
+    def name(self):
+        return self.column + ' ' + self.op + ' ' + str(self.values)
+
+    def to_sql(self):
+        if self.op in ('in', 'not_in'):
+            items = ', '.join("'" + str(v) + "'" for v in self.values)
+            neg   = ' NOT' if self.op == 'not_in' else ''
+            sql   = self.column + neg + ' IN (' + items + ')'
+        else:
+            sql   = self.column + ' ' + _SQL_OPS[self.op] + ' ' + repr(self.values)
+        if self.keep_null:
+            sql = '(' + self.column + ' IS NULL OR ' + sql + ')'
+        if self.scope == 'pre2012':
+            sql = "(trd_rpt_dt >= '" + POST_2012_DATE + "' OR " + sql + ")"
+        return sql
+
+    def mask(self, trace):
+        col  = trace[self.column]
+        null = col.isna() | (col.astype('str') == 'None')
+        if self.op in ('in', 'not_in'):
+            hit = col.astype('str').isin([str(v) for v in self.values])
+            ok  = ~null & (hit if self.op == 'in' else ~hit)
+        else:
+            num = pd.to_numeric(col, errors='coerce')
+            ok  = {'>=': num >= self.values, '>': num > self.values,
+                   '<':  num <  self.values, '<=': num <= self.values}[self.op]
+            ok  = ~null & ok
+        if self.keep_null:
+            ok = ok | null
+        if self.scope == 'pre2012':
+            ok = ok | (pd.to_datetime(trace['trd_rpt_dt']) >= POST_2012_DATE)
+        return ok.to_numpy()
+
+
+class FilterSpec:
+    """A named set of Rules that must all hold."""
+
+    def __init__(self, name, rules):
+        self.name  = name
+        self.rules = list(rules)
+
+    def to_sql(self):
+        return ' AND '.join(rule.to_sql() for rule in self.rules)
+
+    def mask(self, trace):
+        keep = np.ones(len(trace), dtype=bool)
+        for rule in self.rules:
+            keep = keep & rule.mask(trace)
+        return keep
+
+    def apply(self, trace, log=None):
+        """Messages of trace that pass; with a StageLog, rule by rule."""
+        if log is None:
+            return trace[self.mask(trace)]
+        for rule in self.rules:
+            with stage(log, 'filter ' + rule.name, len(trace)) as s:
+                trace = trace[rule.mask(trace)]
+                s.rows_out = len(trace)
+        return trace
+
+
+#* ************************************** */
+#* Filter sets used by the scripts        */
+#* ************************************** */
+# Settlement within two days, not when-issued, not locked-in, no special
+# sale condition; shared by both filter sets #
+_INDICATOR_RULES = [('days_to_sttl_ct', 'in',     ['000', '001', '002'], True),
+                    ('wis_fl',          'not_in', ['Y'],                 True),
+                    ('lckd_in_ind',     'not_in', ['Y'],                 True),
+                    ('sale_cndtn_cd',   'in',     ['@'],                 True)]
+
+# Bai, Bali and Wen (MakeBondIntra_Daily.py): every filter on every message #
+BBW_FILTERS = FilterSpec('bbw',
+    [Rule(c, op, v, keep_null=n) for c, op, v, n in _INDICATOR_RULES] +
+    [Rule('entrd_vol_qt', '>=', 10000),
+     Rule('rptd_pr',      '>',  5),
+     Rule('rptd_pr',      '<',  1000)])
+
+# van Binsbergen, Nozawa and Schwert (MakeIntra_Daily_v2.py and friends):
+# volume on every message, indicators on pre-2012 messages only #
+BBW_V2_FILTERS = FilterSpec('bbw_v2',
+    [Rule('entrd_vol_qt', '>=', 10000)] +
+    [Rule(c, op, v, keep_null=n, scope='pre2012') for c, op, v, n in _INDICATOR_RULES])
+
+
+#* ************************************** */
+#* Verification                           */
+#* ************************************** */
+def _sorted(trace, columns):
+    return trace[columns].astype('str').sort_values(columns).reset_index(drop=True)
+
+
+def check_pushdown(spec, raw, pushed, columns=ENHANCED_COLUMNS):
+    """Raise ValueError unless spec.apply(raw) and pushed hold the same messages."""
+    local = spec.apply(raw)
+    if len(local) != len(pushed):
+        raise ValueError('Filter ' + spec.name + ': pandas keeps ' + str(len(local))
+                         + ' messages, SQL returned ' + str(len(pushed)))
+    if len(local) and not _sorted(local, columns).equals(_sorted(pushed, columns)):
+        raise ValueError('Filter ' + spec.name + ': pandas and SQL kept different messages')
+
+
+def verified_fetch(fetch, spec, table, columns=ENHANCED_COLUMNS):
+    """
+    Wrap fetch(db, cusips) so every chunk is also pulled unfiltered and
+    checked against the pandas mask. Cleaning only ever sees the filtered
+    chunk, so matching chunks mean matching cleaned output.
+    """
+    def _fetch(db, cusips):
+        pushed = fetch(db, cusips)
+        check_pushdown(spec, fetch_chunk(db, cusips, table, columns), pushed, columns)
+        return pushed
+    return _fetch
@@ -0,0 +1,60 @@
+'''
+Overview
+-------------
+Row fingerprints carried through the Dick-Nielsen cleaning.
+
+The matching drops duplicate messages at several steps (trade reports,
+corrections, the surviving records), and drop_duplicates() hashes every
+column of the frame each time. ingest() instead stores one int64 per
+message, msg_fp, a hash of the message identity:
+
+    cusip_id, bond_sym_id, execution and report date and time, msg_seq_nb,
+    orig_msg_seq_nb, trc_st, asof_cd, rptd_pr, entrd_vol_qt, rpt_side_cd,
+    cntra_mp_id
+
+unique() then keeps the first row of each fingerprint, a duplicated() on
+one int64 column. The settlement, when-issued, locked-in and sale-condition
+flags and the yield are not part of the identity: two messages that agree
+on all of the above are the same message.
+
+Frames without msg_fp (chunks that did not go through ingest) fall back to
+drop_duplicates(). With the environment variable
+TRACE_AUDIT_FINGERPRINTS=1, every unique() also runs drop_duplicates() on
+all columns and raises ValueError if the two keep different rows, which
+checks the identity key set (and the absence of hash collisions) on real
+chunks.
+'''
+
+import os
+
+import pandas as pd
+
+FINGERPRINT  = 'msg_fp'
+
+MESSAGE_KEYS = ['cusip_id', 'bond_sym_id', 'trd_exctn_dt', 'trd_exctn_tm',
+                'trd_rpt_dt', 'trd_rpt_tm', 'msg_seq_nb', 'orig_msg_seq_nb',
+                'trc_st', 'asof_cd', 'rptd_pr', 'entrd_vol_qt', 'rpt_side_cd',
+                'cntra_mp_id']
+
+
+def fingerprint(trace):
+    """int64 hash of the MESSAGE_KEYS columns of trace, one per row."""
+    keys = [k for k in MESSAGE_KEYS if k in trace]
+    return pd.util.hash_pandas_object(trace[keys], index=False).to_numpy().view('int64')
+
+
+def auditing():
+    return os.environ.get('TRACE_AUDIT_FINGERPRINTS', '') not in ('', '0')
+
+
+def unique(frame):
+    """frame.drop_duplicates(), by fingerprint when frame carries one."""
+    if FINGERPRINT not in frame:
+        return frame.drop_duplicates()
+    keep = ~frame[FINGERPRINT].duplicated().to_numpy()
+    if auditing():
+        full = ~frame.duplicated().to_numpy()
+        if (keep != full).any():
+            raise ValueError('Fingerprint dedup kept ' + str(keep.sum()) + ' rows, '
+                             'drop_duplicates() kept ' + str(full.sum()))
+    return frame[keep]
@@ -0,0 +1,179 @@
+'''
+Overview
+-------------
+FISD bond universe shared by every stage.
+
+load_fisd() pulls fisd.fisd_mergedissue and fisd.fisd_mergedissuer once,
+merges them the way the scripts do (issue left join issuer) and keeps a
+typed snapshot on disk: flag and code columns are stored as categoricals,
+dates as dates. The snapshot is stamped with a format version and the time
+it was pulled; later runs read it instead of querying WRDS. Delete the file
+(or pass refresh=True) to pull a fresh copy.
+
+universe_mask() is the BBW bond filter written once. Each rule is a set
+membership test evaluated on the categories of a column and looked up by
+code, so the full snapshot is screened in a few vectorized passes. The
+keyword sets below record where stages deliberately differ.
+'''
+
+import datetime as dt
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+FISD_SNAPSHOT_VERSION = 1
+
+FISD_SNAPSHOT = os.path.join('..', '_raw_store', 'fisd.parquet')
+
+ISSUE_COLUMNS  = ['complete_cusip', 'issue_id', 'issuer_id', 'foreign_currency',
+                  'coupon_type', 'coupon', 'convertible', 'asset_backed',
+                  'rule_144a', 'bond_type', 'private_placement',
+                  'interest_frequency', 'dated_date', 'day_count_basis',
+                  'offering_date', 'offering_amt', 'maturity', 'principal_amt']
+
+ISSUER_COLUMNS = ['issuer_id', 'country_domicile', 'sic_code']
+
+# Low-cardinality text columns stored as categoricals #
+CODE_COLUMNS   = ['foreign_currency', 'coupon_type', 'convertible', 'asset_backed',
+                  'rule_144a', 'bond_type', 'private_placement',
+                  'interest_frequency', 'day_count_basis', 'country_domicile',
+                  'sic_code']
+
+#* ************************************** */
+#* Universe rules                         */
+#* ************************************** */
+# Agency, muni, government and other non-corporate bond types #
+EXCLUDED_BOND_TYPES = ['TXMU', 'CCOV', 'CPAS', 'MBS', 'FGOV', 'USTC', 'USBD',
+                       'USNT', 'USSP', 'USSI', 'FGS', 'USBL', 'ABS', 'O30Y',
+                       'O10Y', 'O3Y', 'O5Y', 'O4W', 'CCUR', 'O13W', 'O52W',
+                       'O26W',
+                       # Agency backed / Agency bonds #
+                       'ADEB', 'AMTN', 'ASPZ', 'EMTN', 'ADNT', 'ARNT']
+
+# Preferred securities and inflation indexed securities #
+PREFERRED_AND_INDEXED = ['PSTK', 'PS', 'IIDX']
+
+# Unclassified (-1, 15, 16), variable (13) and bi-monthly (14) coupons #
+EXCLUDED_FREQUENCIES = [-1, 13, 14, 15, 16]
+
+# Fields needed for accrued interest (and hence returns) #
+ACCRUAL_FIELDS = ['dated_date', 'interest_frequency', 'day_count_basis',
+                  'offering_date', 'coupon_type', 'coupon']
+
+# Intraday cleaners: the full BBW universe #
+CLEANER_RULES  = dict()
+
+# MakeSample.py: keeps 144A bonds (private placements only if 144A) and
+# also drops preferred and inflation indexed securities #
+SAMPLE_RULES   = dict(include_144a=True,
+                      bond_types=EXCLUDED_BOND_TYPES + PREFERRED_AND_INDEXED)
+
+# Daily pricing stages: day_count_basis is filled with 30/360 afterwards
+# and dated_date is not required #
+PRICING_RULES  = dict(require=['interest_frequency', 'offering_date'])
+
+# Database stages merge cleaned output, so only variable coupons are
+# dropped and no accrual fields are required #
+DATABASE_RULES = dict(frequencies=[13], require=[])
+
+
+#* ************************************** */
+#* Snapshot                               */
+#* ************************************** */
+def _typed(fisd):
+    for col in CODE_COLUMNS:
+        if col in fisd and fisd[col].dtype == object:
+            fisd[col] = fisd[col].astype('category')
+    return fisd
+
+
+def _pull(db):
+    fisd_issuer = db.raw_sql('SELECT ' + ','.join(ISSUER_COLUMNS) +
+                             ' FROM fisd.fisd_mergedissuer')
+    fisd_issue  = db.raw_sql('SELECT ' + ','.join(ISSUE_COLUMNS) +
+                             ' FROM fisd.fisd_mergedissue')
+    return pd.merge(fisd_issue, fisd_issuer, on=['issuer_id'], how='left')
+
+
+def _stamp(path):
+    meta = pq.read_schema(path).metadata or {}
+    raw  = meta.get(b'tracelib.fisd')
+    return json.loads(raw) if raw else None
+
+
+def load_fisd(db, path=FISD_SNAPSHOT, refresh=False, max_age_days=None):
+    """
+    Merged FISD issue/issuer table from the local snapshot, pulling it from
+    WRDS when there is none, it has another format version, it is older
+    than max_age_days, or refresh is set.
+    """
+    stamp = _stamp(path) if os.path.exists(path) and not refresh else None
+    if stamp is not None and stamp['version'] == FISD_SNAPSHOT_VERSION:
+        age = dt.datetime.now() - dt.datetime.fromisoformat(stamp['pulled_at'])
+        if max_age_days is None or age.days < max_age_days:
+            return pd.read_parquet(path)
+
+    fisd  = _typed(_pull(db))
+    table = pa.Table.from_pandas(fisd, preserve_index=False)
+    meta  = dict(table.schema.metadata or {})
+    meta[b'tracelib.fisd'] = json.dumps({'version': FISD_SNAPSHOT_VERSION,
+                                         'pulled_at': dt.datetime.now().isoformat()})
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    pq.write_table(table.replace_schema_metadata(meta), tmp)
+    os.replace(tmp, path)
+    return fisd
+
+
+def plain(fisd):
+    """Copy with categoricals turned back into object columns (None for missing)."""
+    fisd = fisd.copy()
+    for col in fisd.columns:
+        if isinstance(fisd[col].dtype, pd.CategoricalDtype):
+            fisd[col] = fisd[col].astype(object).where(fisd[col].notna(), None)
+    return fisd
+
+
+#* ************************************** */
+#* Predicate                              */
+#* ************************************** */
+def _isin(col, values, numeric=False):
+    # Evaluated once per category and looked up by code; missing is False #
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        cats = col.cat.categories.to_series()
+        cats = pd.to_numeric(cats, errors='coerce') if numeric else cats
+        hit  = np.append(cats.isin(values).to_numpy(), False)
+        return hit[col.cat.codes.to_numpy()]
+    col = pd.to_numeric(col, errors='coerce') if numeric else col
+    return col.isin(values).to_numpy()
+
+
+def universe_mask(fisd, include_144a=False, bond_types=EXCLUDED_BOND_TYPES,
+                  frequencies=EXCLUDED_FREQUENCIES, require=ACCRUAL_FIELDS):
+    """
+    Boolean mask of the bonds in the BBW universe.
+
+    include_144a keeps Rule 144A bonds and drops private placements only
+    when they are not 144A. interest_frequency is compared by value, so the
+    excluded frequencies apply whether the column holds text or numbers.
+    """
+    keep = _isin(fisd['country_domicile'], ['USA'])        # US issuers
+    keep &= _isin(fisd['foreign_currency'], ['N'])         # US dollar
+    keep &= ~_isin(fisd['coupon_type'], ['V'])             # fixed coupon
+    keep &= _isin(fisd['convertible'], ['N'])              # not convertible
+    keep &= _isin(fisd['asset_backed'], ['N'])             # not asset-backed
+    keep &= ~_isin(fisd['bond_type'], bond_types)          # corporate bond types
+    if include_144a:
+        keep &= ~(_isin(fisd['private_placement'], ['Y']) &
+                  _isin(fisd['rule_144a'], ['N']))
+    else:
+        keep &= _isin(fisd['rule_144a'], ['N'])
+        keep &= _isin(fisd['private_placement'], ['N'])
+    keep &= ~_isin(fisd['interest_frequency'], frequencies, numeric=True)
+    for col in require:
+        keep &= fisd[col].notna().to_numpy()
+    return keep
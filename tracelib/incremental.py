@@ -0,0 +1,115 @@
+'''
+Overview
+-------------
+Incremental updates of the intraday-to-daily output.
+
+Watermarks records, per CUSIP, the latest trd_rpt_dt that has been pulled
+and cleaned. An incremental run pulls, for each CUSIP, every message
+executed on or after its watermark minus lookback_days, so cancellations,
+corrections and reversals reported late still meet the trades they refer
+to. All messages of the re-cleaned execution dates are pulled, so those
+days are rebuilt in full and replace the same days in the existing daily
+files. Messages that arrive more than lookback_days after the trade they
+correct are only picked up by a full run.
+'''
+
+import os
+import threading
+
+import pandas as pd
+
+from tracelib.extract import ENHANCED_COLUMNS, ENHANCED_TABLE, fetch_chunk
+
+
+class Watermarks:
+    """Per-CUSIP watermark file plus the fetch and splice of one run."""
+
+    def __init__(self, path, lookback_days=30, table=ENHANCED_TABLE,
+                 columns=ENHANCED_COLUMNS, where=None):
+        self.path          = path
+        self.lookback_days = lookback_days
+        self.table         = table
+        self.columns       = list(columns)
+        self.where         = where
+        if os.path.exists(path):
+            # CUSIPs stay strings (037833100 would parse as an int) #
+            marks = pd.read_csv(path, parse_dates=['last_rpt_dt'],
+                                dtype={'cusip_id': str})
+            self.marks = marks.set_index('cusip_id')['last_rpt_dt']
+        else:
+            self.marks = pd.Series(dtype='datetime64[ns]', name='last_rpt_dt')
+        # CUSIPs cleaned in this run and their new watermark #
+        self._done  = {}
+        self._lock  = threading.Lock()
+
+    def splice_from(self, cusips):
+        """First execution date to re-clean per CUSIP (NaT: no watermark yet)."""
+        marks = self.marks.reindex(list(cusips))
+        return marks - pd.Timedelta(days=self.lookback_days)
+
+    #* ************************************** */
+    #* Fetch                                  */
+    #* ************************************** */
+    def fetch(self, db, cusips):
+        """
+        Messages of a CUSIP chunk from each CUSIP's splice date on; CUSIPs
+        without a watermark are pulled in full.
+        """
+        since = self.splice_from(cusips)
+        old   = since.dropna()
+        new   = [c for c in since.index if c not in old.index]
+        parts = []
+        if len(old):
+            window = "trd_exctn_dt >= '" + old.min().strftime('%Y-%m-%d') + "'"
+            where  = window if not self.where else self.where + ' AND ' + window
+            pulled = fetch_chunk(db, list(old.index), self.table, self.columns, where)
+            keep   = pd.to_datetime(pulled['trd_exctn_dt']) >= pulled['cusip_id'].map(old)
+            parts.append(pulled[keep.to_numpy()])
+        if new:
+            parts.append(fetch_chunk(db, new, self.table, self.columns, self.where))
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(parts, ignore_index=True)
+
+    #* ************************************** */
+    #* Commit / splice / save                 */
+    #* ************************************** */
+    def commit(self, cusips, trace):
+        """Mark a cleaned chunk as processed through its latest report date."""
+        last = pd.to_datetime(trace['trd_rpt_dt']).max()
+        with self._lock:
+            for c in cusips:
+                self._done[c] = last
+
+    def splice(self, path, tail):
+        """
+        Replace the re-cleaned days of the committed CUSIPs in the daily
+        file at path (indexed by cusip_id, trd_exctn_dt) with tail.
+        """
+        if not os.path.exists(path):
+            return tail
+        head  = pd.read_csv(path, compression='gzip', index_col=[0, 1],
+                            parse_dates=[1], dtype={'cusip_id': str})
+        # The watermarks do not change before save(), so these are the dates
+        # fetch() pulled from, also when it ran in another process #
+        since = self.splice_from(list(self._done))
+        cusip = head.index.get_level_values(0)
+        date  = head.index.get_level_values(1)
+        start = pd.DatetimeIndex(cusip.map(since))
+        drop  = cusip.isin(since.index) & (start.isna() | (date >= start))
+        return pd.concat([head[~drop], tail]).sort_index()
+
+    def save(self):
+        """Write the watermarks, keeping those of CUSIPs not cleaned in this run."""
+        done  = pd.Series(self._done, dtype='datetime64[ns]')
+        # Never move a watermark backwards #
+        old   = self.marks.reindex(done.index)
+        done  = done.where(~(old > done), old)
+        marks = pd.concat([self.marks[~self.marks.index.isin(done.index)], done])
+        marks.index.name = 'cusip_id'
+        marks.name = 'last_rpt_dt'
+        tmp = self.path + '.tmp'
+        marks.reset_index().to_csv(tmp, index=False)
+        os.replace(tmp, self.path)
+        self.marks = marks
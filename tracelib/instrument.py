@@ -0,0 +1,89 @@
+'''
+Overview
+-------------
+Per-stage timings of the cleaning of a chunk.
+
+A StageLog records, for every cleaning rule applied to a chunk, the rows
+that went in and came out, the wall time, and the peak memory allocated
+on top of what was held when the stage started:
+
+    with log.stage('pre_c_cancel', len(pre_t)) as s:
+        clean_pre1 = ...
+        s.rows_out = len(clean_pre1)
+
+stage(log, ...) does the same and does nothing when log is None, so the
+library functions take an optional log. Peak memory comes from
+tracemalloc, which sees the NumPy and pandas buffers but not memory
+allocated by Arrow or a database driver; it slows pandas code down, so
+StageLog(memory=False) records times only. Stages must not be nested.
+
+The scripts keep one StageLog per chunk (it is built where the chunk is
+cleaned, which may be a worker process), write the records of all chunks
+to a Parquet file and print summarize() at the end of the run: total rows
+and seconds per stage and each stage's share of the run time.
+'''
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+LOG_COLUMNS = ['stage', 'rows_in', 'rows_out', 'seconds', 'peak_mb']
+
+
+class _Stage:
+    def __init__(self, rows_in):
+        self.rows_in  = rows_in
+        self.rows_out = None
+
+
+class StageLog:
+    """Rows in and out, wall time and peak memory of each stage of a chunk."""
+
+    def __init__(self, memory=True):
+        self.memory  = memory
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, rows_in):
+        """Time the block as stage name; set rows_out on the yielded object."""
+        s = _Stage(rows_in)
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            held = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield s
+        seconds = time.perf_counter() - start
+        peak    = (tracemalloc.get_traced_memory()[1] - held) / 2**20 if self.memory else None
+        self.records.append({'stage': name, 'rows_in': int(s.rows_in),
+                             'rows_out': int(s.rows_in if s.rows_out is None else s.rows_out),
+                             'seconds': seconds, 'peak_mb': peak})
+
+    def to_frame(self):
+        return pd.DataFrame(self.records, columns=LOG_COLUMNS)
+
+
+@contextmanager
+def stage(log, name, rows_in):
+    """log.stage(name, rows_in), or an untimed block when log is None."""
+    if log is None:
+        yield _Stage(rows_in)
+    else:
+        with log.stage(name, rows_in) as s:
+            yield s
+
+
+def summarize(frame):
+    """Totals per stage of a log of many chunks, in order of first appearance."""
+    order   = pd.unique(frame['stage'])
+    total   = frame.groupby('stage', sort=False).agg(chunks   = ('stage', 'size'),
+                                                     rows_in  = ('rows_in', 'sum'),
+                                                     rows_out = ('rows_out', 'sum'),
+                                                     seconds  = ('seconds', 'sum'),
+                                                     peak_mb  = ('peak_mb', 'max'))
+    total['share'] = (total['seconds'] / total['seconds'].sum()).round(3)
+    total['rows_per_s'] = (total['rows_in'] / total['seconds'].clip(lower=1e-9)).round(0)
+    return total.reindex(order)
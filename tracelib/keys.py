@@ -0,0 +1,132 @@
+'''
+Overview
+-------------
+Integer row keys for matching messages on several columns.
+
+The Dick-Nielsen matching is a series of anti-joins: keep the trade
+reports whose (cusip_id, execution date and time, price, volume, side,
+contra party, sequence number) tuple has no cancelling record. A left
+pd.merge on eight object columns builds a hash table of Python tuples and
+a full merged frame, only to keep the rows where the right side is null.
+
+row_keys() factorizes each key column of both frames together and folds
+the column codes into one int64 per row, so equal tuples get equal keys
+and different tuples different keys (no hashing, so no collisions). The
+anti-join is then a membership test on two int64 arrays. Missing values
+match each other, as they do in pd.merge.
+
+frame_keys() does the same for the rows of one frame; with sort=True the
+keys also sort like the tuples (missing values last, as in sort_values).
+within_sequence() numbers the rows of each group 1, 2, ... in a given
+order, the groupby().cumcount() + 1 of a sorted frame, from one NumPy
+lexsort. Its inner loop is compiled with Numba when Numba is installed.
+'''
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Fold codes into the key while it stays below this bound #
+_KEY_LIMIT = 2 ** 62
+
+
+def _codes(left, right):
+    # Codes of the values of two columns, factorized together; every
+    # missing value gets the same code #
+    both = pd.concat([left.reset_index(drop=True), right.reset_index(drop=True)],
+                     ignore_index=True)
+    codes, uniques = pd.factorize(both)
+    codes = codes.astype('int64')
+    codes[codes == -1] = len(uniques)
+    return codes[:len(left)], codes[len(left):], len(uniques) + 1
+
+
+def row_keys(left, right, left_on, right_on=None):
+    """
+    (left keys, right keys): one int64 per row of left and of right, equal
+    when the left_on values of the row equal the right_on values.
+    """
+    right_on = left_on if right_on is None else right_on
+    if len(left_on) != len(right_on):
+        raise ValueError('left_on and right_on must have the same length')
+    lkey = np.zeros(len(left), dtype='int64')
+    rkey = np.zeros(len(right), dtype='int64')
+    size = 1
+    for lcol, rcol in zip(left_on, right_on):
+        lcodes, rcodes, n = _codes(left[lcol], right[rcol])
+        # Both sides fold together, so they are renumbered together #
+        both, size = _fold(np.concatenate([lkey, rkey]), size,
+                           np.concatenate([lcodes, rcodes]), n, False)
+        lkey, rkey = both[:len(left)], both[len(left):]
+    return lkey, rkey
+
+
+def unmatched(left, right, left_on, right_on=None):
+    """Boolean mask of the rows of left with no match in right (an anti-join)."""
+    if not len(right):
+        return np.ones(len(left), dtype=bool)
+    lkey, rkey = row_keys(left, right, left_on, right_on)
+    return ~np.isin(lkey, rkey)
+
+
+def _fold(key, size, codes, n, sort):
+    # Append the codes of one more column to the keys #
+    if size * n >= _KEY_LIMIT:
+        key, _ = pd.factorize(key, sort=sort)
+        size   = int(key.max()) + 1 if len(key) else 1
+    return key * n + codes, size * n
+
+
+def frame_keys(frame, columns, sort=False):
+    """
+    One int64 per row of frame, equal when the values in columns are equal.
+    sort=True makes the keys sort like the rows sorted by columns.
+    """
+    key  = np.zeros(len(frame), dtype='int64')
+    size = 1
+    for col in columns:
+        codes, uniques = pd.factorize(frame[col], sort=sort)
+        codes = codes.astype('int64')
+        codes[codes == -1] = len(uniques)
+        key, size = _fold(key, size, codes, len(uniques) + 1, sort)
+    return key
+
+
+def _number_loop(groups):
+    # 1, 2, ... along each run of equal values of the sorted groups #
+    seq = np.empty(len(groups), dtype=np.int64)
+    run = 0
+    for i in range(len(groups)):
+        if i == 0 or groups[i] != groups[i - 1]:
+            run = 0
+        run += 1
+        seq[i] = run
+    return seq
+
+
+def _number_numpy(groups):
+    n      = len(groups)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    first  = np.repeat(starts, np.diff(np.r_[starts, n]))
+    return np.arange(1, n + 1) - first
+
+
+_number = numba.njit(cache=True)(_number_loop) if numba is not None else _number_numpy
+
+
+def within_sequence(groups, order):
+    """
+    1-based position of each row within its group (equal values of
+    groups), counting rows in ascending order of the int64 keys order.
+    """
+    groups = np.asarray(groups, dtype='int64')
+    if not len(groups):
+        return np.zeros(0, dtype='int64')
+    idx = np.lexsort((order, groups))
+    seq = np.empty(len(groups), dtype='int64')
+    seq[idx] = _number(groups[idx])
+    return seq
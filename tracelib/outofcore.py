@@ -0,0 +1,71 @@
+'''
+Overview
+-------------
+Out-of-core output for the intraday-to-daily cleaners.
+
+The cleaners append every chunk's daily prices, volumes and bid / ask
+prices to lists and concatenate them at the end, so a full run holds the
+whole daily panel in memory next to the chunk being cleaned. A ChunkSpill
+writes each chunk's frames to disk as soon as they come back,
+
+    <root>/<name>/chunk=<i>.parquet
+
+(index included), and to_csv() streams the chunk files, in chunk order,
+into the same gzip CSV that pd.concat(frames).to_csv() wrote: one chunk is
+in memory at a time, whatever the size of the sample. to_artifact() does
+the same for the Parquet copy (tracelib.artifacts). The spill folder is
+emptied when a ChunkSpill is opened on it, so it only ever holds the
+current run.
+'''
+
+import glob
+import gzip
+import os
+import shutil
+
+import pandas as pd
+
+from tracelib.artifacts import append_artifact, clear_artifact
+
+
+class ChunkSpill:
+    """Result frames of each chunk on disk, one folder per output name."""
+
+    def __init__(self, root, names):
+        self.root  = root
+        self.names = list(names)
+        for name in self.names:
+            folder = os.path.join(root, name)
+            if os.path.exists(folder):
+                shutil.rmtree(folder)
+            os.makedirs(folder)
+
+    def _path(self, name, i):
+        return os.path.join(self.root, name, 'chunk=' + str(i).zfill(6) + '.parquet')
+
+    def write(self, name, i, frame):
+        """Spill the frame of output name for chunk i."""
+        if name not in self.names:
+            raise ValueError('Unknown output ' + str(name))
+        frame.to_parquet(self._path(name, i))
+
+    def frames(self, name):
+        """The spilled frames of name, one at a time, in chunk order."""
+        for path in sorted(glob.glob(os.path.join(self.root, name, 'chunk=*.parquet'))):
+            yield pd.read_parquet(path)
+
+    def read(self, name):
+        """All spilled frames of name, concatenated (held in memory)."""
+        return pd.concat(list(self.frames(name)), axis=0, ignore_index=False)
+
+    def to_csv(self, name, path):
+        """Stream the frames of name into one gzip CSV at path."""
+        with gzip.open(path, 'wt', newline='') as f:
+            for k, frame in enumerate(self.frames(name)):
+                frame.to_csv(f, header = k == 0)
+
+    def to_artifact(self, name, path):
+        """Stream the frames of name into one Parquet dataset at path."""
+        clear_artifact(path)
+        for k, frame in enumerate(self.frames(name)):
+            append_artifact(frame, path, part=k)
@@ -0,0 +1,97 @@
+'''
+Overview
+-------------
+Clean CUSIP chunks in parallel worker processes.
+
+Chunks are independent: every cleaning and aggregation step is keyed on
+cusip_id. ChunkPool runs work(db, cusips) for each chunk in a pool of
+n_workers processes. Each worker opens its own connection with connect()
+when it starts, so a worker pulls, cleans and aggregates its chunk without
+touching the main process, and only the (small) daily results are sent
+back. Results are handed back strictly in chunk order, and at most
+max_pending chunks are in flight or waiting, as in ChunkPrefetcher.
+
+max_memory_mb caps the address space of every worker (resource.RLIMIT_AS),
+so a chunk that would take the machine down raises a MemoryError naming
+the chunk instead. Leave room for the libraries: a worker with pandas,
+pyarrow and a database driver loaded already maps a few hundred MB.
+
+Workers are forked, so work and connect may be functions defined in the
+calling script, and they see its globals (the raw store, the filters) as
+they were when the pool started. Fork is not available on Windows; use
+n_workers = 1 there. Connections are opened in the workers, so a WRDS
+login must not prompt for a password (save it in ~/.pgpass first).
+'''
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# The worker's connection, opened by _start #
+_db = None
+
+
+def _start(connect, max_memory_mb):
+    global _db
+    if max_memory_mb is not None and resource is not None:
+        limit = int(max_memory_mb) << 20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    _db = connect()
+
+
+def _run(work, i, cusips, max_memory_mb):
+    try:
+        return work(_db, cusips)
+    except MemoryError:
+        raise MemoryError('Chunk ' + str(i) + ' (' + str(len(cusips)) + ' CUSIPs) '
+                          'exceeded the worker memory limit of '
+                          + str(max_memory_mb) + ' MB') from None
+
+
+class ChunkPool:
+    """
+    Iterate over (i, work(db, chunks[i])) in chunk order, running work in
+    n_workers processes, each with its own connection from connect().
+    """
+
+    def __init__(self, chunks, work, connect, n_workers=4, max_memory_mb=None,
+                 max_pending=None):
+        if n_workers < 1:
+            raise ValueError('n_workers must be at least 1')
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise ValueError('ChunkPool needs the fork start method; '
+                             'use n_workers = 1 on this platform')
+        self.chunks        = list(chunks)
+        self.work          = work
+        self.connect       = connect
+        self.n_workers     = n_workers
+        self.max_memory_mb = max_memory_mb
+        self.max_pending   = max(max_pending or 2 * n_workers, n_workers)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __iter__(self):
+        executor = ProcessPoolExecutor(max_workers = self.n_workers,
+                                       mp_context  = multiprocessing.get_context('fork'),
+                                       initializer = _start,
+                                       initargs    = (self.connect, self.max_memory_mb))
+        pending = deque()
+        nxt = 0
+        try:
+            while nxt < len(self.chunks) or pending:
+                # Keep every worker busy, holding at most max_pending results #
+                while nxt < len(self.chunks) and len(pending) < self.max_pending:
+                    pending.append(executor.submit(_run, self.work, nxt, self.chunks[nxt],
+                                                   self.max_memory_mb))
+                    nxt += 1
+                i = nxt - len(pending)
+                result = pending.popleft().result()
+                yield i, result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,91 @@
+'''
+Overview
+-------------
+Chunks of CUSIPs sized by the number of messages they pull.
+
+Fixed 500-CUSIP chunks range from a few hundred messages to tens of
+millions, depending on how liquid the bonds are. message_counts() gets the
+number of messages per CUSIP: from the raw store's manifest for CUSIPs it
+already holds, and from one SELECT cusip_id, count(*) ... GROUP BY query
+per block of the remaining CUSIPs, with the same where clause as the
+pull. plan_chunks() then packs the CUSIPs into chunks of about row_budget
+messages each: the largest CUSIPs are placed first, always into the
+currently lightest chunk. A CUSIP with more than row_budget messages gets
+a chunk of its own.
+'''
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from tracelib.extract import ENHANCED_TABLE
+
+
+def count_sql(table=ENHANCED_TABLE, where=None):
+    """Messages per CUSIP for a block of CUSIPs bound through %(cusip_id)s."""
+    sql = 'SELECT cusip_id, count(*) AS n_msgs FROM ' + table + \
+          ' WHERE cusip_id in %(cusip_id)s'
+    if where:
+        sql = sql + ' AND (' + where + ')'
+    return sql + ' GROUP BY cusip_id'
+
+
+def message_counts(db, cusips, table=ENHANCED_TABLE, where=None, store=None,
+                   block=5000):
+    """
+    Series of messages per CUSIP (0 for none), indexed like cusips. CUSIPs
+    held by store (a RawTraceStore) are counted from its manifest.
+    """
+    cusips = list(cusips)
+    counts = pd.Series(0, index=pd.Index(cusips, name='cusip_id'),
+                       dtype='int64', name='n_msgs')
+    cold   = cusips
+    if store is not None:
+        held = store.manifest.set_index('cusip_id')['n_msgs']
+        warm = held.reindex(cusips).dropna()
+        counts[warm.index] = warm.astype('int64')
+        cold = [c for c in cusips if c not in warm.index]
+    for i in range(0, len(cold), block):
+        found = db.raw_sql(count_sql(table, where),
+                           params={'cusip_id': tuple(cold[i:i + block])})
+        if len(found):
+            counts[found['cusip_id']] = found['n_msgs'].astype('int64').to_numpy()
+    return counts
+
+
+def plan_chunks(counts, row_budget=1000000, max_cusips=5000):
+    """
+    Pack the CUSIPs of counts (messages per CUSIP) into chunks of about
+    row_budget messages and at most max_cusips CUSIPs. Chunks are returned
+    heaviest first; within a chunk CUSIPs keep the order of counts.
+    """
+    if row_budget < 1 or max_cusips < 1:
+        raise ValueError('row_budget and max_cusips must be at least 1')
+    if not len(counts):
+        return []
+    rows     = counts.to_numpy(dtype='int64')
+    small    = rows <= row_budget
+    total    = int(rows[small].sum())
+    n_chunks = max(-(-total // row_budget), -(-int(small.sum()) // max_cusips), 1)
+    order    = np.argsort(-rows, kind='stable')
+
+    # Oversized CUSIPs alone; the rest fill the lightest of n_chunks bins,
+    # ties going to the bin with fewer CUSIPs so empty CUSIPs spread out #
+    alone    = [[i] for i in order if not small[i]]
+    bins     = [[] for _ in range(n_chunks)]
+    heap     = [(0, 0, b) for b in range(n_chunks)]
+    for i in order[small[order]]:
+        load, size, b = heapq.heappop(heap)
+        bins[b].append(i)
+        heapq.heappush(heap, (load + rows[i], size + 1, b))
+
+    # A full bin is a chunk; a chunk past max_cusips is split #
+    chunks = alone
+    for members in bins:
+        members = sorted(members)
+        chunks += [members[j:j + max_cusips] for j in range(0, len(members), max_cusips)]
+    chunks = [c for c in chunks if c]
+    chunks.sort(key=lambda c: -rows[c].sum())
+    index  = counts.index
+    return [list(index[c]) for c in chunks]
@@ -0,0 +1,70 @@
+'''
+Overview
+-------------
+Fetch CUSIP chunks ahead of the cleaning loop.
+
+ChunkPrefetcher keeps n_connections database connections open and lets
+worker threads pull upcoming chunks while the main thread cleans the
+current one. At most max_prefetch chunks are held in memory (in flight or
+waiting), and chunks are handed back strictly in order, so the cleaning
+loop is unchanged apart from where the data comes from.
+'''
+
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ChunkPrefetcher:
+    """
+    Iterate over (i, trace) for each chunk in chunks.
+
+    fetch(db, cusips) pulls one chunk, e.g. RawTraceStore.fetch or
+    tracelib.extract.fetch_chunk. connect() opens one connection, e.g.
+    wrds.Connection; it is called n_connections times up front, in the
+    calling thread, so any login prompt appears as usual.
+    """
+
+    def __init__(self, chunks, fetch, connect, n_connections=4, max_prefetch=8):
+        if n_connections < 1 or max_prefetch < 1:
+            raise ValueError('n_connections and max_prefetch must be at least 1')
+        self.chunks        = list(chunks)
+        self.fetch         = fetch
+        self.connect       = connect
+        self.n_connections = n_connections
+        self.max_prefetch  = max(max_prefetch, n_connections)
+
+    def _run(self, pool, cusips):
+        db = pool.get()
+        try:
+            return self.fetch(db, cusips)
+        finally:
+            pool.put(db)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __iter__(self):
+        pool = queue.Queue()
+        connections = [self.connect() for _ in range(self.n_connections)]
+        for db in connections:
+            pool.put(db)
+
+        executor = ThreadPoolExecutor(max_workers=self.n_connections)
+        pending  = deque()
+        nxt = 0
+        try:
+            while nxt < len(self.chunks) or pending:
+                # Keep the window of in-flight chunks full #
+                while nxt < len(self.chunks) and len(pending) < self.max_prefetch:
+                    pending.append(executor.submit(self._run, pool, self.chunks[nxt]))
+                    nxt += 1
+                i = nxt - len(pending)
+                trace = pending.popleft().result()
+                yield i, trace
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            for db in connections:
+                close = getattr(db, 'close', None)
+                if close is not None:
+                    close()
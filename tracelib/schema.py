@@ -0,0 +1,121 @@
+'''
+Overview
+-------------
+Typed, compact in-memory schema for TRACE Enhanced messages.
+
+Pulled chunks arrive with every text, date and time field as a column of
+Python objects. ingest() types a chunk once, before any filter or merge:
+
+    trc_st, asof_cd, rpt_side_cd, cntra_mp_id and the
+    settlement / when-issued / locked-in / sale-condition flags   category
+    msg_seq_nb, orig_msg_seq_nb                                   int64 (Int64 with NULLs)
+    trd_exctn_dt, trd_rpt_dt                                      datetime64
+    trd_exctn_tm, trd_rpt_tm (time of day)                        timedelta64
+    entrd_vol_qt, rptd_pr, yld_pt                                 float64
+
+Dates and times are converted once per distinct value and mapped back by
+code, and the execution timestamp is the date plus the time of day, so
+nothing is formatted to a string and parsed again. cusip_id and
+bond_sym_id stay object columns: they are groupby keys in the cleaners,
+and a categorical groupby key expands to every category combination.
+
+ingest() also adds msg_fp, the int64 fingerprint of each message that the
+Dick-Nielsen matching deduplicates on (tracelib.fingerprint).
+
+Missing values stay missing (NaN / NaT / <NA>), and equal values stay
+equal, so sorting, matching and the tracelib.filters masks give the same
+result as on the raw chunk.
+'''
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from tracelib.fingerprint import FINGERPRINT, fingerprint
+
+CATEGORY_COLUMNS = ['trc_st', 'asof_cd', 'rpt_side_cd', 'cntra_mp_id',
+                    'days_to_sttl_ct', 'wis_fl', 'lckd_in_ind', 'sale_cndtn_cd']
+
+INT_COLUMNS      = ['msg_seq_nb', 'orig_msg_seq_nb']
+
+DATE_COLUMNS     = ['trd_exctn_dt', 'trd_rpt_dt']
+
+TIME_COLUMNS     = ['trd_exctn_tm', 'trd_rpt_tm']
+
+FLOAT_COLUMNS    = ['entrd_vol_qt', 'rptd_pr', 'yld_pt']
+
+
+def _by_value(col, convert, missing):
+    # Convert each distinct value once and look it up by code; code -1
+    # (missing) picks the appended missing value #
+    codes, uniques = pd.factorize(col)
+    values = np.append(convert(pd.Series(uniques, dtype=object)).to_numpy(), missing)
+    return pd.Series(values[codes], index=col.index)
+
+
+def _dates(values):
+    return pd.to_datetime(values).astype('datetime64[ns]')
+
+
+def _times(values):
+    def _td(t):
+        if isinstance(t, dt.time):
+            return pd.Timedelta(hours=t.hour, minutes=t.minute, seconds=t.second,
+                                microseconds=t.microsecond)
+        return pd.Timedelta(str(t))
+    return pd.Series([_td(t) for t in values], dtype='timedelta64[ns]')
+
+
+def _int(col):
+    # Sequence numbers are numeric text; a column that is not stays text #
+    num = pd.to_numeric(col, errors='coerce')
+    if (num.isna() & col.notna()).any():
+        return col.astype('category')
+    if num.isna().any():
+        return num.astype('Int64')
+    return num.astype('int64')
+
+
+def ingest(trace, timestamp=False):
+    """
+    Chunk with the compact column types above and the message fingerprint
+    msg_fp (tracelib.fingerprint). timestamp=True also adds trd_exctn_dtm,
+    the execution date plus time of day.
+    """
+    trace = trace.copy()
+    for col in DATE_COLUMNS:
+        if col in trace and not pd.api.types.is_datetime64_any_dtype(trace[col]):
+            trace[col] = _by_value(trace[col], _dates, np.datetime64('NaT', 'ns'))
+    for col in TIME_COLUMNS:
+        if col in trace and not pd.api.types.is_timedelta64_dtype(trace[col]):
+            trace[col] = _by_value(trace[col], _times, np.timedelta64('NaT', 'ns'))
+    for col in CATEGORY_COLUMNS:
+        if col in trace:
+            trace[col] = trace[col].astype('category')
+    for col in INT_COLUMNS:
+        if col in trace:
+            trace[col] = _int(trace[col])
+    for col in FLOAT_COLUMNS:
+        if col in trace:
+            trace[col] = pd.to_numeric(trace[col]).astype('float64')
+    if timestamp:
+        trace['trd_exctn_dtm'] = trace['trd_exctn_dt'] + trace['trd_exctn_tm']
+    trace[FINGERPRINT] = fingerprint(trace)
+    return trace
+
+
+def memory_per_million(trace):
+    """Memory held by a chunk, in MB per million messages (= bytes per message)."""
+    if not len(trace):
+        return 0.0
+    return round(trace.memory_usage(deep=True).sum() / len(trace), 1)
+
+
+def memory_report(trace):
+    """MB per million messages by column, before and after ingest()."""
+    typed = ingest(trace)
+    n     = max(len(trace), 1)
+    return pd.DataFrame({'raw':   trace.memory_usage(deep=True, index=False) / n,
+                         'typed': typed.memory_usage(deep=True, index=False) / n}) \
+             .round(1)
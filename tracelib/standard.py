@@ -0,0 +1,111 @@
+'''
+Overview
+-------------
+TRACE standard feeds (BTDS and BTDS 144A) in the TRACE Enhanced schema.
+
+Rule 144A bonds are disseminated in trace_standard.trace until 2014-06-30
+and in trace_standard.trace_btds144a from then on. fetch_standard() pulls a
+CUSIP chunk from both, with only the columns it needs and the feed boundary
+applied in each query (trans_dt before / from the boundary), and
+normalize() maps the result onto ENHANCED_COLUMNS, so the chunk goes
+through tracelib.schema.ingest, the tracelib.filters specs, the chunk
+planner and the parallel pool like an Enhanced chunk:
+
+    trd_rpt_dt     trans_dt (dissemination date); trd_rpt_tm is missing
+    entrd_vol_qt   ascii_rptd_vol_tx, capped volumes at their cap
+                   (5MM+ = 5,000,000, 1MM+ = 1,000,000)
+    trc_st         G / M -> T, H / N -> C, I / O -> W
+    rpt_side_cd    diss_rptg_side_cd
+    cntra_mp_id    contra_party_type
+
+Codes and volume texts are mapped once per distinct value through the
+tables below. The standard feeds report cancellations (C) and corrections
+(W) against orig_msg_seq_nb on every date, the pre-2012 Enhanced format,
+so clean_standard() runs the pre-2012 Dick-Nielsen matching on all
+messages instead of splitting at 2012-02-06.
+'''
+
+import numpy as np
+import pandas as pd
+
+from tracelib.dick_nielsen import clean_pre_2012
+from tracelib.extract import ENHANCED_COLUMNS, fetch_chunk
+
+BTDS_TABLE     = 'trace_standard.trace'
+BTDS144A_TABLE = 'trace_standard.trace_btds144a'
+
+# Dissemination date from which 144A trades are in their own feed #
+BTDS144A_DATE  = '2014-06-30'
+
+STANDARD_COLUMNS = ['cusip_id', 'bond_sym_id', 'trd_exctn_dt', 'trd_exctn_tm',
+                    'trans_dt', 'days_to_sttl_ct', 'lckd_in_ind', 'wis_fl',
+                    'sale_cndtn_cd', 'msg_seq_nb', 'trc_st', 'ascii_rptd_vol_tx',
+                    'rptd_pr', 'yld_pt', 'asof_cd', 'orig_msg_seq_nb',
+                    'diss_rptg_side_cd', 'contra_party_type']
+
+# Standard trade status codes and their Enhanced equivalent #
+TRC_ST_CODES   = {'G': 'T', 'M': 'T', 'H': 'C', 'N': 'C', 'I': 'W', 'O': 'W'}
+
+# Volume texts of capped trades #
+VOLUME_CAPS    = {'5MM+': 5000000.0, '1MM+': 1000000.0}
+
+_RENAME = {'trans_dt': 'trd_rpt_dt',
+           'diss_rptg_side_cd': 'rpt_side_cd',
+           'contra_party_type': 'cntra_mp_id'}
+
+
+def _recode(col, table):
+    # Categorical of col with each distinct value looked up once in table #
+    codes, uniques = pd.factorize(col)
+    mapped = pd.Series([table.get(u, u) for u in uniques], dtype=object)
+    cats   = pd.unique(mapped.dropna())
+    lookup = pd.Categorical(mapped, categories=cats).codes
+    return pd.Series(pd.Categorical.from_codes(np.append(lookup, -1)[codes], cats),
+                     index=col.index)
+
+
+def _volume(col):
+    # ascii_rptd_vol_tx as a number, capped texts at their cap #
+    codes, uniques = pd.factorize(col)
+    values = pd.Series([VOLUME_CAPS.get(u, u) for u in uniques], dtype=object)
+    values = np.append(pd.to_numeric(values, errors='coerce').to_numpy('float64'), np.nan)
+    return pd.Series(values[codes], index=col.index)
+
+
+def normalize(trace):
+    """A standard-feed chunk as ENHANCED_COLUMNS."""
+    out = trace.rename(columns=_RENAME)
+    out['trc_st']       = _recode(trace['trc_st'], TRC_ST_CODES)
+    out['entrd_vol_qt'] = _volume(trace['ascii_rptd_vol_tx'])
+    out['trd_rpt_tm']   = None
+    return out[ENHANCED_COLUMNS]
+
+
+def standard_sql(feed):
+    """WHERE clause keeping the dates disseminated in feed (a table name)."""
+    if feed == BTDS_TABLE:
+        return "trans_dt < '" + BTDS144A_DATE + "'"
+    if feed == BTDS144A_TABLE:
+        return "trans_dt >= '" + BTDS144A_DATE + "'"
+    raise ValueError('Unknown standard feed ' + str(feed))
+
+
+def fetch_standard(db, cusips):
+    """Messages of a CUSIP chunk from both feeds, normalized."""
+    parts = [fetch_chunk(db, cusips, feed, STANDARD_COLUMNS, standard_sql(feed))
+             for feed in (BTDS_TABLE, BTDS144A_TABLE)]
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return pd.DataFrame(columns=ENHANCED_COLUMNS)
+    return normalize(pd.concat(parts, ignore_index=True))
+
+
+def clean_standard(trace, columns=None, log=None):
+    """
+    Cleaned trade reports of a normalized chunk with the given columns
+    (default: those of trace) and a fresh index; log is passed to
+    clean_pre_2012.
+    """
+    columns = list(trace.columns) if columns is None else list(columns)
+    named   = trace[trace['cusip_id'] != '']
+    return clean_pre_2012(named, log)[columns].reset_index(drop=True)
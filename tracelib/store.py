@@ -0,0 +1,291 @@
+'''
+Overview
+-------------
+Local, partitioned Parquet store for raw TRACE messages.
+
+Messages are written once per CUSIP under
+
+    <root>/bucket=<crc32(cusip) % n_buckets>/year=<trade year>/part-*.parquet
+
+and a manifest records which CUSIPs have been pulled in full (including
+CUSIPs that returned no messages). When every CUSIP of a chunk is in the
+manifest the chunk is read back from disk with column projection and
+partition pruning; otherwise only the missing CUSIPs are pulled from WRDS.
+By default the store holds the raw, unfiltered messages, so cleaning rules
+can be changed and re-run without downloading the data again. A store
+created with a where clause (e.g. tracelib.filters pushed into the query)
+holds only the messages that pass it, and refuses to be reopened with a
+different one, or for a different table. Every store has the same fixed column types (column_type:
+dates, times and prices / volumes / yields typed, everything else text),
+so no chunk can fix a type from a column that happens to be all missing.
+The manifest and schema are written under a lock file, so
+several processes (tracelib.parallel) may fill one store at once. evict()
+drops CUSIPs whose history was revised on WRDS (tracelib.digest), so the
+next fetch() pulls them again.
+'''
+
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from tracelib.extract import ENHANCED_COLUMNS, ENHANCED_TABLE, fetch_chunk
+from tracelib.schema import DATE_COLUMNS, FLOAT_COLUMNS, TIME_COLUMNS
+
+STORE_VERSION = 1
+
+
+@contextmanager
+def _file_lock(path, timeout=600):
+    # Lock shared between processes: whoever creates path holds it #
+    start = time.time()
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.time() - start > timeout:
+                raise ValueError('Lock ' + path + ' held for more than ' + str(timeout)
+                                 + ' s; remove it if no other process is running')
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+
+def column_type(col):
+    """Arrow type a raw message column is stored as."""
+    if col in DATE_COLUMNS:
+        return pa.date32()
+    if col in TIME_COLUMNS:
+        return pa.time64('us')
+    if col in FLOAT_COLUMNS:
+        return pa.float64()
+    return pa.string()
+
+
+def store_schema(columns):
+    """Schema of a store holding columns (column_type of each)."""
+    return pa.schema([pa.field(c, column_type(c)) for c in columns])
+
+
+def _to_table(trace, schema):
+    # Arrow table of a chunk in the store's schema. Stores whose schema was
+    # inferred from their first chunk hold some columns as text; values
+    # for those are written as text #
+    trace = trace.copy()
+    for f in schema:
+        col = trace[f.name]
+        if pa.types.is_string(f.type) and col.dtype != object:
+            trace[f.name] = col.astype(str).where(col.notna().to_numpy(), None)
+    return pa.Table.from_pandas(trace, schema=schema, preserve_index=False)
+
+
+def cusip_bucket(cusips, n_buckets):
+    """Stable hash bucket of each CUSIP (crc32, not the salted hash())."""
+    return np.array([zlib.crc32(str(c).encode()) % n_buckets for c in cusips],
+                    dtype='int32')
+
+
+class RawTraceStore:
+    """Raw message cache for one TRACE table, partitioned by bucket/year."""
+
+    def __init__(self, root, table=ENHANCED_TABLE, columns=ENHANCED_COLUMNS,
+                 n_buckets=64, where=None):
+        self.root      = root
+        self.table     = table
+        self.columns   = list(columns)
+        self.n_buckets = n_buckets
+        self.where     = where
+        # Chunks may be fetched from several threads (tracelib.prefetch) #
+        self._lock     = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+        meta_path = os.path.join(root, '_store.json')
+        meta = {'version': STORE_VERSION,
+                'n_buckets': n_buckets,
+                'columns': self.columns,
+                'table': table,
+                'where': where}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored = json.load(f)
+            if stored['version'] != STORE_VERSION or \
+               stored['n_buckets'] != n_buckets:
+                raise ValueError('Store at ' + root + ' was written with a '
+                                 'different version or bucket count')
+            # Stores written before the table was recorded hold the default #
+            if stored.get('table', ENHANCED_TABLE) != table:
+                raise ValueError('Store at ' + root + ' holds ' + stored.get('table', ENHANCED_TABLE)
+                                 + ', not ' + table)
+            if stored.get('where') != where:
+                raise ValueError('Store at ' + root + ' was filled with a '
+                                 'different where clause')
+            if not set(self.columns) <= set(stored['columns']):
+                raise ValueError('Store at ' + root + ' does not hold columns '
+                                 + str(sorted(set(self.columns) - set(stored['columns']))))
+            self.columns = stored['columns']
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+
+        self._manifest_path = os.path.join(root, '_manifest.parquet')
+        self._schema_path   = os.path.join(root, '_common_metadata')
+        self._lock_path     = os.path.join(root, '_store.lock')
+        if os.path.exists(self._manifest_path):
+            self.manifest = pd.read_parquet(self._manifest_path)
+        else:
+            self.manifest = pd.DataFrame({'cusip_id': pd.Series(dtype='object'),
+                                          'n_msgs': pd.Series(dtype='int64'),
+                                          'fetched_at': pd.Series(dtype='datetime64[ns]')})
+
+    #* ************************************** */
+    #* Manifest                               */
+    #* ************************************** */
+    def warm_cusips(self, cusips):
+        """Subset of cusips already held in full by the store."""
+        held = set(self.manifest['cusip_id'])
+        return [c for c in cusips if c in held]
+
+    def is_warm(self, cusips):
+        return len(self.warm_cusips(cusips)) == len(cusips)
+
+    def _mark(self, cusips, trace):
+        counts = trace.groupby('cusip_id').size() if len(trace) else pd.Series(dtype='int64')
+        self.mark(cusips, counts)
+
+    def mark(self, cusips, counts):
+        """Record cusips as held in full; counts holds messages per CUSIP."""
+        new = pd.DataFrame({'cusip_id': list(cusips)})
+        new['n_msgs'] = new['cusip_id'].map(counts).fillna(0).astype('int64')
+        new['fetched_at'] = pd.Timestamp.now()
+        with self._lock, _file_lock(self._lock_path):
+            self._replace_manifest(new['cusip_id'], new)
+
+    def _replace_manifest(self, cusips, new=None):
+        # Drop cusips from the manifest and add the rows of new; called with
+        # the file lock held. Other processes may have marked CUSIPs since
+        # the manifest was read #
+        if os.path.exists(self._manifest_path):
+            self.manifest = pd.read_parquet(self._manifest_path)
+        kept = self.manifest[~self.manifest['cusip_id'].isin(cusips)]
+        if new is None:
+            manifest = kept.reset_index(drop=True)
+        else:
+            manifest = pd.concat([kept, new], ignore_index=True) if len(kept) else new
+        tmp = self._manifest_path + '.' + uuid.uuid4().hex + '.tmp'
+        manifest.to_parquet(tmp, index=False)
+        os.replace(tmp, self._manifest_path)
+        self.manifest = manifest
+
+    def evict(self, cusips):
+        """Remove the messages of cusips, so the next fetch pulls them again."""
+        cusips = self.warm_cusips(cusips)
+        if not cusips:
+            return
+        drop = pa.array(cusips, type=pa.string())
+        with self._lock, _file_lock(self._lock_path):
+            for b in np.unique(cusip_bucket(cusips, self.n_buckets)):
+                pattern = os.path.join(self.root, 'bucket=' + str(b), '*', '*.parquet')
+                for path in glob.glob(pattern):
+                    table = pq.ParquetFile(path).read()
+                    keep  = pc.invert(pc.is_in(table['cusip_id'], value_set=drop))
+                    if pc.all(keep).as_py():
+                        continue
+                    table = table.filter(keep)
+                    if table.num_rows:
+                        # Hidden from readers until it replaces the file #
+                        tmp = os.path.join(os.path.dirname(path), '_' + uuid.uuid4().hex + '.tmp')
+                        pq.write_table(table, tmp)
+                        os.replace(tmp, path)
+                    else:
+                        os.remove(path)
+            self._replace_manifest(cusips)
+
+    #* ************************************** */
+    #* Write / read                           */
+    #* ************************************** */
+    def _schema(self):
+        # The stored schema, written as store_schema() by the first write #
+        with _file_lock(self._lock_path):
+            if os.path.exists(self._schema_path):
+                return pq.read_schema(self._schema_path)
+            schema = store_schema(self.columns)
+            pq.write_metadata(schema, self._schema_path)
+            return schema
+
+    def write(self, trace, cusips):
+        """Add the messages of cusips to the store and mark them as held."""
+        if len(trace):
+            trace = trace[self.columns]
+            with self._lock:
+                schema = self._schema()
+            table = _to_table(trace, schema)
+            year = pd.to_datetime(trace['trd_exctn_dt']).dt.year.fillna(0).astype('int32')
+            table = table.append_column('bucket', pa.array(cusip_bucket(trace['cusip_id'], self.n_buckets)))
+            table = table.append_column('year', pa.array(year.to_numpy()))
+            # Written to a staging folder (hidden from readers by its leading
+            # underscore) and moved into place, so no process reads a file
+            # that is still being written #
+            token = uuid.uuid4().hex
+            stage = os.path.join(self.root, '_stage-' + token)
+            pq.write_to_dataset(table, stage,
+                                partition_cols=['bucket', 'year'],
+                                basename_template='part-' + token + '-{i}.parquet',
+                                existing_data_behavior='overwrite_or_ignore')
+            for folder, _, files in os.walk(stage):
+                target = os.path.join(self.root, os.path.relpath(folder, stage))
+                os.makedirs(target, exist_ok=True)
+                for name in files:
+                    os.replace(os.path.join(folder, name), os.path.join(target, name))
+            shutil.rmtree(stage)
+        self._mark(cusips, trace)
+
+    def read(self, cusips, columns=None):
+        """Messages for cusips, reading only the requested columns."""
+        columns = self.columns if columns is None else list(columns)
+        if not os.path.exists(self._schema_path):
+            return pd.DataFrame(columns=columns)
+        dataset = ds.dataset(self.root, format='parquet', partitioning='hive',
+                             schema=pq.read_schema(self._schema_path)
+                                      .append(pa.field('bucket', pa.int32()))
+                                      .append(pa.field('year', pa.int32())))
+        buckets = np.unique(cusip_bucket(cusips, self.n_buckets)).tolist()
+        flt = ds.field('bucket').isin(buckets) & ds.field('cusip_id').isin(list(cusips))
+        return dataset.to_table(columns=columns, filter=flt).to_pandas()
+
+    def fetch(self, db, cusips, table=None):
+        """
+        Messages for a CUSIP chunk: warm CUSIPs come from disk, the rest
+        are pulled from WRDS once and written to the store.
+        """
+        cusips = list(cusips)
+        warm = self.warm_cusips(cusips)
+        held = set(warm)
+        cold = [c for c in cusips if c not in held]
+        parts = []
+        if warm:
+            parts.append(self.read(warm))
+        if cold:
+            pulled = fetch_chunk(db, cold, table or self.table, self.columns,
+                                 self.where)
+            self.write(pulled, cold)
+            parts.append(pulled[self.columns])
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,119 @@
+'''
+Overview
+-------------
+Streaming pulls of large WRDS tables.
+
+db.raw_sql materializes a whole result set before the script can drop a
+single row, so pulls such as fisd.fisd_ratings or wrdsapps.bondret peak at
+the size of the table. stream_sql() instead runs the query on a server-side
+cursor (a named PostgreSQL cursor on WRDS, a plain cursor on an
+OfflineConnection) and yields it as DataFrame batches of chunksize rows. A
+background thread fetches and builds the next batches while the caller
+filters the current one; at most max_ahead batches wait in the queue, so
+peak memory is set by the batch size and by what the filter keeps.
+
+Batches carry the row numbers of the full result as their index, and
+read_filtered() concatenates the kept rows, so its output is the same
+frame (index included) as filtering the raw_sql result.
+'''
+
+import queue
+import threading
+
+import pandas as pd
+
+from tracelib.connection import OfflineConnection
+
+_DONE = object()
+
+
+def _open(db, sql, params):
+    # Returns (fetchmany, columns, close) for a cursor over the query #
+    if isinstance(db, OfflineConnection):
+        cur  = db.cursor(sql, params)
+        cols = [d[0] for d in cur.description]
+        return cur.fetchmany, cols, cur.close
+    # wrds.Connection: SQLAlchemy engine, stream_results gives a named cursor #
+    conn = db.engine.connect().execution_options(stream_results=True)
+    try:
+        res = conn.exec_driver_sql(sql, params) if params else conn.exec_driver_sql(sql)
+    except BaseException:
+        conn.close()
+        raise
+
+    def _close():
+        res.close()
+        conn.close()
+    return res.fetchmany, list(res.keys()), _close
+
+
+def _frame(rows, columns, start, dtypes):
+    batch = pd.DataFrame.from_records(rows, columns=[c.lower() for c in columns],
+                                      coerce_float=True)
+    batch.index = pd.RangeIndex(start, start + len(batch))
+    if dtypes:
+        batch = batch.astype(dtypes)
+    return batch
+
+
+def stream_sql(db, sql, params=None, chunksize=100000, dtypes=None, max_ahead=2):
+    """
+    Yield the result of a query as DataFrame batches of at most chunksize
+    rows, cast to dtypes. An empty result yields one empty batch.
+    """
+    batches = queue.Queue(maxsize=max_ahead)
+    stop    = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _produce():
+        try:
+            fetchmany, columns, close = _open(db, sql, params)
+            try:
+                start = 0
+                while not stop.is_set():
+                    rows = fetchmany(chunksize)
+                    if not rows and start:
+                        break
+                    _put(_frame(rows, columns, start, dtypes))
+                    start += len(rows)
+                    if not rows:
+                        break
+            finally:
+                close()
+            _put(_DONE)
+        except BaseException as e:
+            _put(e)
+
+    worker = threading.Thread(target=_produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
+
+def read_filtered(db, sql, keep=None, params=None, chunksize=100000,
+                  dtypes=None, max_ahead=2):
+    """
+    Stream a query and return the rows kept by keep(batch) -> batch (for
+    example FilterSpec.apply), concatenated.
+    """
+    parts = []
+    for batch in stream_sql(db, sql, params, chunksize, dtypes, max_ahead):
+        parts.append(batch if keep is None else keep(batch))
+    kept = [p for p in parts if len(p)]
+    return pd.concat(kept) if kept else parts[0]
@@ -11,7 +11,11 @@ from pandas.tseries.offsets import *
 import datetime as datetime
 from pandas.tseries.offsets import *
 import pyreadstat
-import wrds
+import sys
+sys.path.append('..')
+from tracelib.fisd import load_fisd, universe_mask, plain, DATABASE_RULES
+from tracelib.connection import connect
+from tracelib.stream import read_filtered
 import pandasql as ps
 import urllib.request
 import zipfile
@@ -20,85 +24,21 @@ tqdm.pandas()
 #* ************************************** */
 #* Connect to WRDS                        */
 #* ************************************** */  
-db = wrds.Connection()
+db = connect()
 
 #* ************************************** */
-#* WRDS Bond Returns                      */
-#* ************************************** */  
-# We only require 6 variables from the WRDS Bond Returns Module
-traced = db.raw_sql("""SELECT  DATE, CUSIP, RET_L5M, TMT, 
-                       AMOUNT_OUTSTANDING,OFFERING_AMT, N_SP, N_MR, YIELD,
-                       PRICE_L5M
-                       FROM wrdsapps.bondret
-                  """)
-
-#* ************************************** */
-#* Download Mergent File                  */
+#* Load Mergent File                      */
 #* ************************************** */  
-fisd_issuer = db.raw_sql("""SELECT issuer_id,country_domicile,sic_code                
-                  FROM fisd.fisd_mergedissuer 
-                  """)
-
-fisd_issue = db.raw_sql("""SELECT complete_cusip, issue_id,
-                  issuer_id, foreign_currency,
-                  coupon_type,coupon,convertible,
-                  asset_backed,rule_144a,
-                  bond_type,private_placement,
-                  interest_frequency,dated_date,
-                  day_count_basis,offering_date,
-                  offering_amt
-                  FROM fisd.fisd_mergedissue  
-                  """)
-                  
-fisd = pd.merge(fisd_issue, fisd_issuer, on = ['issuer_id'], how = "left")                              
+# Issue and issuer tables, read from the local snapshot after the first
+# pull (tracelib.fisd) #
+fisd = load_fisd(db)
 #* ************************************** */
 #* Apply BBW Bond Filters                 */
 #* ************************************** */  
-#1: Discard all non-US Bonds (i) in BBW
-fisd = fisd[(fisd.country_domicile == 'USA')]
-
-#2.1: US FX
-fisd = fisd[(fisd.foreign_currency == 'N')]
-
-#3: Must have a fixed coupon
-fisd = fisd[(fisd.coupon_type != 'V')]
-
-#4: Discard ALL convertible bonds
-fisd = fisd[(fisd.convertible == 'N')]
-
-#5: Discard all asset-backed bonds
-fisd = fisd[(fisd.asset_backed == 'N')]
-
-#6: Discard all bonds under Rule 144A
-fisd = fisd[(fisd.rule_144a == 'N')]
-
-#7: Remove Agency bonds, Muni Bonds, Government Bonds, 
-mask_corp = ((fisd.bond_type != 'TXMU')&  (fisd.bond_type != 'CCOV') &  (fisd.bond_type != 'CPAS')\
-            &  (fisd.bond_type != 'MBS') &  (fisd.bond_type != 'FGOV')\
-            &  (fisd.bond_type != 'USTC')   &  (fisd.bond_type != 'USBD')\
-            &  (fisd.bond_type != 'USNT')  &  (fisd.bond_type != 'USSP')\
-            &  (fisd.bond_type != 'USSI') &  (fisd.bond_type != 'FGS')\
-            &  (fisd.bond_type != 'USBL') &  (fisd.bond_type != 'ABS')\
-            &  (fisd.bond_type != 'O30Y')\
-            &  (fisd.bond_type != 'O10Y') &  (fisd.bond_type != 'O3Y')\
-            &  (fisd.bond_type != 'O5Y') &  (fisd.bond_type != 'O4W')\
-            &  (fisd.bond_type != 'CCUR') &  (fisd.bond_type != 'O13W')\
-            &  (fisd.bond_type != 'O52W')\
-            &  (fisd.bond_type != 'O26W')\
-            # Remove all Agency backed / Agency bonds #
-            &  (fisd.bond_type != 'ADEB')\
-            &  (fisd.bond_type != 'AMTN')\
-            &  (fisd.bond_type != 'ASPZ')\
-            &  (fisd.bond_type != 'EMTN')\
-            &  (fisd.bond_type != 'ADNT')\
-            &  (fisd.bond_type != 'ARNT'))
-fisd = fisd[(mask_corp)]
-
-#8: No Private Placement
-fisd = fisd[(fisd.private_placement == 'N')]
-
-#9: Remove floating-rate, bi-monthly and unclassified coupons
-fisd = fisd[(fisd.interest_frequency != 13) ] # Variable Coupon (V)
+# 1-9: non-US, foreign currency, variable coupon, convertible,
+# asset-backed, Rule 144A, non-corporate bond types, private placement
+# and variable coupon frequency (tracelib.fisd.DATABASE_RULES) #
+fisd = plain(fisd[universe_mask(fisd, **DATABASE_RULES)])
 
 fisd['offering_date']            = pd.to_datetime(fisd['offering_date'], 
                                                   format='%Y-%m-%d')
@@ -107,6 +47,19 @@ fisd['dated_date']               = pd.to_datetime(fisd['dated_date'],
 
 fisd.rename(columns={'complete_cusip':'cusip'}, inplace=True)
 
+#* ************************************** */
+#* WRDS Bond Returns                      */
+#* ************************************** */  
+# We only require 6 variables from the WRDS Bond Returns Module
+# Streamed in batches (tracelib.stream); only bonds in the FISD universe
+# are kept, the rest would be dropped by the merge below #
+traced = read_filtered(db, """SELECT  DATE, CUSIP, RET_L5M, TMT, 
+                       AMOUNT_OUTSTANDING,OFFERING_AMT, N_SP, N_MR, YIELD,
+                       PRICE_L5M
+                       FROM wrdsapps.bondret
+                  """,
+                       keep = lambda b: b[b['cusip'].isin(fisd['cusip'])])
+
 
 #* ************************************** */
 #* Merge                                  */